@@ -0,0 +1,167 @@
+"""Fixtures for the benchmark suite.
+
+Run with `pixi run bench`. Benchmarks that need Redis start a private
+redis-server (skipped if it is not installed), or use the one at
+BENCH_REDIS_URL. Results are written as JSON to benchmarks/results/, or to
+BENCH_OUTPUT, to be compared between commits.
+"""
+
+import datetime
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+import redis
+
+ROOT = Path(__file__).parent.parent
+
+
+def raise_fd_limit(wanted=8192):
+    "Allow enough sockets for a thousand subscribers, here and in the server."
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard != resource.RLIM_INFINITY:
+        wanted = min(wanted, hard)
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+raise_fd_limit()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(ready, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if ready():
+                return
+        except Exception:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Timed out waiting for a benchmark process to start")
+        time.sleep(0.05)
+
+
+def stop(process, timeout=10.0):
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+@pytest.fixture(scope="session")
+def results():
+    "Benchmark results, saved as JSON when the session ends."
+    results = {}
+    yield results
+    if not results:
+        return
+    now = datetime.datetime.now(datetime.timezone.utc)
+    commit = git_commit()
+    output = os.environ.get("BENCH_OUTPUT")
+    if output is None:
+        name = f"{now:%Y%m%dT%H%M%S}-{(commit or 'unknown')[:10]}.json"
+        output = ROOT / "benchmarks" / "results" / name
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "commit": commit,
+        "timestamp": now.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nBenchmark results written to {output}")
+
+
+@pytest.fixture
+def record(request, results):
+    "Record the measurements of the current benchmark under its test id."
+
+    def record(**measurements):
+        results[request.node.name] = measurements
+        print(f"\n{request.node.name}: {json.dumps(measurements)}")
+
+    return record
+
+
+@pytest.fixture(scope="session")
+def redis_url():
+    "URL of a Redis server to benchmark against."
+    url = os.environ.get("BENCH_REDIS_URL")
+    if url is not None:
+        yield url
+        return
+    executable = shutil.which("redis-server")
+    if executable is None:
+        pytest.skip("redis-server not found; install it or set BENCH_REDIS_URL")
+    port = free_port()
+    process = subprocess.Popen(
+        [executable, "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"redis://127.0.0.1:{port}/0"
+    try:
+        wait_until(lambda: redis.Redis.from_url(url).ping())
+        yield url
+    finally:
+        stop(process)
+
+
+@pytest.fixture(scope="session")
+def server_url(redis_url):
+    "Base URL of the server, run by uvicorn in a subprocess."
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "server:app",
+            "--host",
+            "127.0.0.1",
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+        ],
+        cwd=ROOT,
+        env={**os.environ, "REDIS_URL": redis_url},
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until(
+            lambda: socket.create_connection(("127.0.0.1", port)).close() or True
+        )
+        yield url
+    finally:
+        stop(process)
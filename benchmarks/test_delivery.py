@@ -0,0 +1,124 @@
+import asyncio
+import struct
+import time
+
+import httpx
+import msgpack
+import numpy as np
+import pytest
+import websockets
+
+UPLOAD_CHUNK = 1000  # frames per batch request when preparing a replay
+LIVE_FRAMES = 50
+LIVE_INTERVAL = 0.02  # seconds between live frames
+
+
+def ws_url(server_url, path):
+    return server_url.replace("http://", "ws://", 1) + path
+
+
+def binary_payload(message):
+    "Payload bytes of a binary envelope."
+    (header_length,) = struct.unpack_from("!I", message)
+    return message[4 + header_length :]
+
+
+async def create_node(client):
+    return (await client.post("/upload")).json()["node_id"]
+
+
+@pytest.mark.parametrize("envelope_format", ["json", "binary"])
+@pytest.mark.parametrize("frames", [1000, 10000])
+def test_replay_speed(record, server_url, envelope_format, frames):
+    """Frames per second replayed to a new subscriber from seq_num=1."""
+    payload = np.random.random(1024).tobytes()
+
+    async def run():
+        async with httpx.AsyncClient(base_url=server_url, timeout=60) as client:
+            node_id = await create_node(client)
+            for start in range(0, frames, UPLOAD_CHUNK):
+                batch = [payload] * min(UPLOAD_CHUNK, frames - start)
+                response = await client.post(
+                    f"/upload/{node_id}/batch",
+                    content=msgpack.packb(batch),
+                    headers={"Content-Type": "application/msgpack"},
+                )
+                response.raise_for_status()
+
+            url = ws_url(
+                server_url,
+                f"/stream/single/{node_id}?seq_num=1&envelope_format={envelope_format}",
+            )
+            async with websockets.connect(url, max_size=None) as websocket:
+                start = time.perf_counter()
+                for _ in range(frames):
+                    await websocket.recv()
+                elapsed = time.perf_counter() - start
+            await client.delete(f"/upload/{node_id}")
+            return elapsed
+
+    elapsed = asyncio.run(run())
+    record(
+        frames=frames,
+        payload_bytes=len(payload),
+        envelope_format=envelope_format,
+        seconds=elapsed,
+        frames_per_second=frames / elapsed,
+    )
+
+
+@pytest.mark.parametrize("subscribers", [1, 100, 1000])
+def test_delivery_latency(record, server_url, subscribers):
+    """Write-to-deliver latency of live frames fanned out to many subscribers.
+
+    Each frame carries the time it was written; every subscriber measures how
+    long it took to arrive.
+    """
+    latencies = []
+
+    async def subscriber(websocket):
+        for _ in range(LIVE_FRAMES):
+            message = await websocket.recv()
+            (sent,) = np.frombuffer(binary_payload(message), dtype=np.float64)
+            latencies.append(time.time() - sent)
+
+    async def run():
+        async with httpx.AsyncClient(base_url=server_url, timeout=60) as client:
+            node_id = await create_node(client)
+            # seq_num=1 so that no frame is missed while subscriptions settle.
+            url = ws_url(
+                server_url, f"/stream/single/{node_id}?seq_num=1&envelope_format=binary"
+            )
+            websockets_ = []
+            try:
+                for start in range(0, subscribers, 100):
+                    websockets_ += await asyncio.gather(
+                        *(
+                            websockets.connect(url, max_size=None)
+                            for _ in range(min(100, subscribers - start))
+                        )
+                    )
+                receivers = asyncio.gather(*map(subscriber, websockets_))
+                for _ in range(LIVE_FRAMES):
+                    await client.post(
+                        f"/upload/{node_id}",
+                        content=np.array([time.time()]).tobytes(),
+                        headers={"Content-Type": "application/octet-stream"},
+                    )
+                    await asyncio.sleep(LIVE_INTERVAL)
+                await asyncio.wait_for(receivers, timeout=120)
+            finally:
+                await asyncio.gather(*(websocket.close() for websocket in websockets_))
+                await client.delete(f"/upload/{node_id}")
+
+    asyncio.run(run())
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99]) * 1e3
+    record(
+        subscribers=subscribers,
+        frames=LIVE_FRAMES,
+        deliveries=len(latencies),
+        p50_ms=p50,
+        p90_ms=p90,
+        p99_ms=p99,
+        max_ms=max(latencies) * 1e3,
+    )
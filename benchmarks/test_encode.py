@@ -0,0 +1,34 @@
+import json
+import time
+
+import numpy as np
+import pytest
+
+from server import encode_message
+
+# Payload sizes in float64 values: a scalar reading, a line, a 1 MiB image.
+SIZES = [1, 1024, 128 * 1024]
+
+
+@pytest.mark.parametrize("envelope_format", ["json", "msgpack", "binary"])
+@pytest.mark.parametrize("values", SIZES)
+def test_encode_cost(record, envelope_format, values):
+    """Time encode_message, the per-frame work done on a cache miss."""
+    payload = np.random.random(values).tobytes()
+    metadata = json.dumps(
+        {"timestamp": "2025-01-01T00:00:00", "Content-Type": "application/octet-stream"}
+    ).encode("utf-8")
+
+    iterations = 0
+    start = time.perf_counter()
+    while (elapsed := time.perf_counter() - start) < 0.5 or iterations < 10:
+        encode_message("1", 1, payload, metadata, envelope_format)
+        iterations += 1
+    message, _ = encode_message("1", 1, payload, metadata, envelope_format)
+
+    record(
+        payload_bytes=len(payload),
+        message_bytes=len(message),
+        iterations=iterations,
+        us_per_frame=elapsed / iterations * 1e6,
+    )
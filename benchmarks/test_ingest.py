@@ -0,0 +1,51 @@
+import asyncio
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+CONCURRENCY = 8
+BYTES_PER_RUN = 64 * 1024 * 1024
+
+
+@pytest.mark.parametrize("payload_bytes", [64, 1024, 64 * 1024, 1024 * 1024])
+def test_append_throughput(record, server_url, payload_bytes):
+    """Frames and bytes appended per second over HTTP, by payload size."""
+    count = max(200, min(5000, BYTES_PER_RUN // payload_bytes))
+    payload = np.random.bytes(payload_bytes)
+    latencies = []
+
+    async def run():
+        async with httpx.AsyncClient(base_url=server_url, timeout=30) as client:
+            node_id = (await client.post("/upload")).json()["node_id"]
+            remaining = iter(range(count))
+
+            async def writer():
+                for _ in remaining:
+                    start = time.perf_counter()
+                    response = await client.post(
+                        f"/upload/{node_id}",
+                        content=payload,
+                        headers={"Content-Type": "application/octet-stream"},
+                    )
+                    response.raise_for_status()
+                    latencies.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            await asyncio.gather(*(writer() for _ in range(CONCURRENCY)))
+            elapsed = time.perf_counter() - start
+            await client.delete(f"/upload/{node_id}")
+            return elapsed
+
+    elapsed = asyncio.run(run())
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1e3
+    record(
+        payload_bytes=payload_bytes,
+        frames=count,
+        concurrency=CONCURRENCY,
+        frames_per_second=count / elapsed,
+        mib_per_second=count * payload_bytes / elapsed / 2**20,
+        request_p50_ms=p50,
+        request_p99_ms=p99,
+    )
@@ -1,34 +1,77 @@
-import os
-from locust import HttpUser, task, between, events
-from locust_plugins.users.socketio import SocketIOUser
-import numpy as np
-import time
+import itertools
 import json
-import msgpack
 import logging
+import os
+import struct
+import time
+
 import httpx
+import msgpack
+import numpy as np
+from locust import HttpUser, between, events, task
+from locust_plugins.users.socketio import SocketIOUser
+
+# Scenario parameters, set by run_scenarios.py or by hand:
+# Writers and subscribers are spread round-robin over NODE_COUNT nodes with
+# consecutive ids from NODE_ID.
+NODE_ID = int(os.getenv("NODE_ID", 481980))
+NODE_COUNT = int(os.getenv("NODE_COUNT", 1))
+# float64 values per frame; the first carries the write time.
+PAYLOAD_SIZE = int(os.getenv("PAYLOAD_SIZE", 5))
+# Seconds between the writes of each writer
+WRITE_WAIT_MIN = float(os.getenv("WRITE_WAIT_MIN", 0.1))
+WRITE_WAIT_MAX = float(os.getenv("WRITE_WAIT_MAX", 0.2))
+# Writers reset their node after this many frames; 0 never does.
+RESET_EVERY = int(os.getenv("RESET_EVERY", 20))
+ENVELOPE_FORMAT = os.getenv("ENVELOPE_FORMAT", "msgpack")  # json, msgpack, binary
+# Subscribers drop their connection this often (in seconds) and reconnect
+# with seq_num to replay what they missed; 0 never does.
+RECONNECT_INTERVAL = float(os.getenv("RECONNECT_INTERVAL", 0))
+
+
+def node_for(index):
+    return NODE_ID + index % NODE_COUNT
+
+
+def decode(message):
+    "Return the sequence number and the first payload value of a message."
+    if ENVELOPE_FORMAT == "binary":
+        (header_length,) = struct.unpack_from("!I", message)
+        header = json.loads(message[4 : 4 + header_length])
+        payload = message[4 + header_length :]
+        first = None
+        if header["dtype"] is not None and len(payload) >= 8:
+            first = float(np.frombuffer(payload, header["dtype"], count=1)[0])
+        return header["sequence"], first
+    data = (
+        msgpack.unpackb(message) if isinstance(message, bytes) else json.loads(message)
+    )
+    payload = data.get("payload")
+    return data.get("sequence"), float(payload[0]) if payload else None
 
 
 class WriterUser(HttpUser):
-    wait_time = between(0.1, 0.2)  # Wait 0.1-0.2 seconds between writes
+    wait_time = between(WRITE_WAIT_MIN, WRITE_WAIT_MAX)
     weight = int(os.getenv("WRITER_WEIGHT", 1))
+    indices = itertools.count()
 
     def on_start(self):
         """Initialize user state"""
-        # Use a fixed node_id so StreamingUser can connect to it
-        self.node_id = 481980
+        self.node_id = node_for(next(self.indices))
         self.message_count = 0
+        self.payload = np.zeros(PAYLOAD_SIZE)
 
     @task(10)  # Run 10x as often as cleanup
     def write_data(self):
-        # Create data with incrementing value
-        binary_data = (np.ones(5) * time.time()).tobytes()
+        # The first value is the write time, for measuring delivery latency
+        self.payload[0] = time.time()
 
         # Post data and check response
         response = self.client.post(
             f"/upload/{self.node_id}",
-            data=binary_data,
+            data=self.payload.tobytes(),
             headers={"Content-Type": "application/octet-stream"},
+            name="/upload/[node_id]",
         )
 
         # Log status like writing_client
@@ -43,8 +86,8 @@ class WriterUser(HttpUser):
     @task
     def cleanup(self):
         """Periodically delete the node like the real client"""
-        if self.message_count > 20:
-            self.client.delete(f"/upload/{self.node_id}")
+        if RESET_EVERY and self.message_count > RESET_EVERY:
+            self.client.delete(f"/upload/{self.node_id}", name="/upload/[node_id]")
             self.message_count = 0
             logging.info(f"Cleaned up node {self.node_id}")
 
@@ -54,49 +97,66 @@ class StreamingUser(SocketIOUser):
 
     wait_time = between(0.1, 0.2)
     weight = int(os.getenv("STREAMING_WEIGHT", 1))
+    indices = itertools.count()
 
     def on_start(self):
         """Connect to the streaming endpoint"""
-        # Use the same node_id as WriterUser
-        self.node_id = 481980
-        self.envelope_format = "msgpack"  # or "json"
-
-        # Connect to WebSocket endpoint
-        ws_url = f"ws://{self.host.replace('http://', '').replace('https://', '')}/stream/single/{self.node_id}?envelope_format={self.envelope_format}"
+        self.node_id = node_for(next(self.indices))
+        self.last_sequence = None
+        self.connect_stream()
+
+    def connect_stream(self):
+        """Connect, resuming after the last frame received if there was one."""
+        host = self.host.replace("http://", "").replace("https://", "")
+        ws_url = (
+            f"ws://{host}/stream/single/{self.node_id}"
+            f"?envelope_format={ENVELOPE_FORMAT}"
+        )
+        if self.last_sequence is not None:
+            ws_url += f"&seq_num={self.last_sequence + 1}"
+        self.connected_at = time.time()
+        self.reconnect_at = (
+            self.connected_at + RECONNECT_INTERVAL * np.random.uniform(0.5, 1.5)
+            if RECONNECT_INTERVAL
+            else None
+        )
         self.connect(ws_url)
 
     def on_message(self, message):
         """Process websocket messages and measure latency"""
         try:
             received_time = time.time()
-
-            if isinstance(message, bytes):
-                data = msgpack.unpackb(message)
-            else:
-                data = json.loads(message)
-
-            # Pull out timestamp from the payload
-            payload = data.get("payload", [])
-            if payload and len(payload) > 0:
-                write_time = float(payload[0])
-                latency_ms = (received_time - write_time) * 1000
-
-                logging.info(
-                    f"WS latency (server sequence {data.get('sequence')}): {latency_ms:.1f}ms"
-                )
-
-                events.request.fire(
-                    request_type="WS",
-                    name="write_to_websocket_delivery",
-                    response_time=latency_ms,
-                    response_length=0,
-                    exception=None,
-                )
+            sequence, write_time = decode(message)
+            if sequence is not None:
+                self.last_sequence = sequence
+            if write_time is None:
+                return
+
+            latency_ms = (received_time - write_time) * 1000
+            logging.info(f"WS latency (server sequence {sequence}): {latency_ms:.1f}ms")
+
+            # Frames written before this connection are replayed, and timed
+            # apart from live delivery.
+            replayed = write_time < self.connected_at
+            events.request.fire(
+                request_type="WS",
+                name="replay_delivery" if replayed else "write_to_websocket_delivery",
+                response_time=latency_ms,
+                response_length=len(message),
+                exception=None,
+            )
 
         except Exception as e:
             logging.error(f"Error processing message: {e}")
 
     @task
     def keep_alive(self):
-        """Dummy task to keep the user active while listening for messages"""
-        pass
+        """Reconnect when due; otherwise just keep listening for messages"""
+        if self.reconnect_at is not None and time.time() >= self.reconnect_at:
+            self.ws_greenlet.kill()
+            self.ws.close()
+            self.connect_stream()
+
+    def on_stop(self):
+        self.ws_greenlet.kill()
+        self.ws.close()
@@ -3,6 +3,12 @@
 # Resource Usage Monitor for Load Testing
 # Single snapshot of Kubernetes resources - use with 'watch' command
 # Usage: watch -n 5 ./monitor_resources.sh
+#
+# With --compose, the containers of the local docker-compose stack are shown
+# instead (docker, or podman if docker is missing; override with
+# CONTAINER_ENGINE). Add --csv for "name,cpu_percent,memory_bytes" lines, as
+# sampled by run_scenarios.py.
+#   watch -n 5 ./monitor_resources.sh --compose
 
 set -e
 
@@ -134,6 +140,47 @@ monitor_pods() {
 }
 
 
+# Convert a docker/podman memory figure such as "123.4MiB" to bytes
+to_bytes() {
+    echo "$1" | awk '{
+        match($0, /^[0-9.]+/)
+        value = substr($0, 1, RLENGTH)
+        unit = substr($0, RLENGTH + 1)
+        factor = 1
+        if (unit == "kB") factor = 1000
+        else if (unit == "KiB") factor = 1024
+        else if (unit == "MB") factor = 1000 ^ 2
+        else if (unit == "MiB") factor = 1024 ^ 2
+        else if (unit == "GB") factor = 1000 ^ 3
+        else if (unit == "GiB") factor = 1024 ^ 3
+        printf "%d\n", value * factor
+    }'
+}
+
+# Function to monitor the containers of the compose stack
+monitor_compose() {
+    local csv="$1"
+    local engine="${CONTAINER_ENGINE:-$(command -v docker >/dev/null && echo docker || echo podman)}"
+
+    [[ -z "$csv" ]] && echo "=== CONTAINER METRICS ($engine) ===" && \
+        printf "%-30s %-12s %-12s\n" "NAME" "%CPU" "MEMORY" && \
+        printf "%-30s %-12s %-12s\n" "----" "----" "------"
+
+    "$engine" stats --no-stream --format '{{.Name}}\t{{.CPUPerc}}\t{{.MemUsage}}' 2>/dev/null |
+    grep -E 'streaming_api|redis' | while IFS=$'\t' read name cpu mem; do
+        mem="${mem%% /*}"
+        if [[ -n "$csv" ]]; then
+            echo "$name,${cpu%\%},$(to_bytes "$mem")"
+        else
+            printf "%-30s %-12s %-12s\n" "$name" "$cpu" "$mem"
+        fi
+    done
+}
+
 # Main execution - single snapshot
+if [[ "$1" == "--compose" ]]; then
+    monitor_compose "$([[ "$2" == "--csv" ]] && echo csv)"
+    exit 0
+fi
 monitor_nodes
 monitor_pods
@@ -0,0 +1,208 @@
+"""Run the load test scenarios headless and report them against SLOs.
+
+Each scenario of scenarios.json runs mixed_load_test.py with its own users,
+duration and environment (node count, payload size, writer and streaming
+weights, envelope format, reconnect interval). Meanwhile the containers of
+the local compose stack are sampled with monitor_resources.sh. The report
+gives p50/p99 write-to-delivery latency, delivered messages per second and
+peak server CPU and RSS, checked against the SLO thresholds: the global
+"slo" of scenarios.json, overridden per scenario. It is printed, and written
+as report.md and report.json next to Locust's CSV files.
+
+    pixi run loadtest
+    python run_scenarios.py --host http://localhost:8000 --only fan_out
+
+The exit status is 1 if any SLO was missed.
+"""
+
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+HERE = Path(__file__).parent
+DELIVERY = "write_to_websocket_delivery"
+REPLAY = "replay_delivery"
+# Containers whose usage is checked against the SLOs; others are reported.
+SERVER_CONTAINER = "streaming_api"
+
+
+def sample_resources(samples, stop, interval):
+    "Append (name, cpu_percent, memory_bytes) samples until stop is set."
+    while not stop.is_set():
+        result = subprocess.run(
+            [str(HERE / "monitor_resources.sh"), "--compose", "--csv"],
+            capture_output=True,
+            text=True,
+        )
+        for line in result.stdout.splitlines():
+            try:
+                name, cpu, memory = line.split(",")
+                samples.append((name, float(cpu), int(memory)))
+            except ValueError:
+                pass
+        stop.wait(interval)
+
+
+def read_stats(csv_prefix):
+    "Rows of Locust's stats CSV by request name."
+    with open(f"{csv_prefix}_stats.csv", newline="") as f:
+        return {row["Name"]: row for row in csv.DictReader(f)}
+
+
+def summarize(stats, samples):
+    def number(name, column):
+        row = stats.get(name)
+        return float(row[column]) if row and row[column] not in ("", "N/A") else None
+
+    cpu, rss = {}, {}
+    for name, cpu_percent, memory in samples:
+        cpu[name] = max(cpu.get(name, 0.0), cpu_percent)
+        rss[name] = max(rss.get(name, 0), memory)
+    servers = [name for name in cpu if SERVER_CONTAINER in name]
+    return {
+        "p50_ms": number(DELIVERY, "50%"),
+        "p99_ms": number(DELIVERY, "99%"),
+        "delivered_per_s": number(DELIVERY, "Requests/s"),
+        "replay_p99_ms": number(REPLAY, "99%"),
+        "replayed_per_s": number(REPLAY, "Requests/s"),
+        "writes_per_s": number("/upload/[node_id]", "Requests/s"),
+        "write_failures": number("Aggregated", "Failure Count"),
+        "max_cpu_percent": max((cpu[name] for name in servers), default=None),
+        "max_rss_mb": max((rss[name] for name in servers), default=0) / 2**20
+        if servers
+        else None,
+        "containers": {
+            name: {"max_cpu_percent": cpu[name], "max_rss_mb": rss[name] / 2**20}
+            for name in sorted(cpu)
+        },
+    }
+
+
+def check(summary, slo):
+    "Return the SLOs missed, as messages; unmeasured values are not checked."
+    missed = []
+    for key, limit in slo.items():
+        if key.startswith("min_"):
+            value = summary.get(key[len("min_") :])
+            if value is not None and value < limit:
+                missed.append(f"{key[len('min_') :]} {value:.1f} < {limit}")
+        else:
+            value = summary.get(key)
+            if value is not None and value > limit:
+                missed.append(f"{key} {value:.1f} > {limit}")
+    return missed
+
+
+def run(scenario, host, output, slo, interval):
+    name = scenario["name"]
+    csv_prefix = output / name
+    env = {**os.environ, **{k: str(v) for k, v in scenario.get("env", {}).items()}}
+    command = [
+        "locust",
+        "-f",
+        str(HERE / "mixed_load_test.py"),
+        "--host",
+        host,
+        "--headless",
+        "--users",
+        str(scenario["users"]),
+        "--spawn-rate",
+        str(scenario["spawn_rate"]),
+        "--run-time",
+        scenario["duration"],
+        "--csv",
+        str(csv_prefix),
+        "--only-summary",
+        "--loglevel",
+        "WARNING",
+        *scenario.get("locust_args", []),
+    ]
+    print(f"=== {name}: {' '.join(command[3:])}")
+    samples, stop = [], threading.Event()
+    sampler = threading.Thread(target=sample_resources, args=(samples, stop, interval))
+    sampler.start()
+    try:
+        # Locust exits with 1 when any request failed, which is reported below.
+        exit_code = subprocess.run(command, env=env).returncode
+    finally:
+        stop.set()
+        sampler.join()
+    summary = summarize(read_stats(csv_prefix), samples)
+    summary["locust_exit_code"] = exit_code
+    summary["slo"] = slo
+    summary["missed"] = check(summary, slo)
+    return summary
+
+
+def format_value(value):
+    return "-" if value is None else f"{value:.1f}"
+
+
+def report(results):
+    columns = [
+        ("p50 ms", "p50_ms"),
+        ("p99 ms", "p99_ms"),
+        ("delivered/s", "delivered_per_s"),
+        ("replay p99 ms", "replay_p99_ms"),
+        ("writes/s", "writes_per_s"),
+        ("CPU %", "max_cpu_percent"),
+        ("RSS MB", "max_rss_mb"),
+    ]
+    lines = [
+        "| scenario | " + " | ".join(title for title, _ in columns) + " | SLO |",
+        "|---" * (len(columns) + 2) + "|",
+    ]
+    for name, summary in results.items():
+        values = [format_value(summary[key]) for _, key in columns]
+        verdict = "; ".join(summary["missed"]) or "ok"
+        lines.append(f"| {name} | " + " | ".join(values) + f" | {verdict} |")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="http://localhost:8000")
+    parser.add_argument("--scenarios", type=Path, default=HERE / "scenarios.json")
+    parser.add_argument(
+        "--only", action="append", help="Run only this scenario (repeatable)"
+    )
+    parser.add_argument("--output", type=Path, default=HERE / "results")
+    parser.add_argument(
+        "--interval", type=float, default=5.0, help="Seconds between resource samples"
+    )
+    args = parser.parse_args()
+
+    config = json.loads(args.scenarios.read_text())
+    scenarios = [
+        scenario
+        for scenario in config["scenarios"]
+        if not args.only or scenario["name"] in args.only
+    ]
+    if not scenarios:
+        sys.exit(f"No scenario named {', '.join(args.only)}")
+    args.output.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    for scenario in scenarios:
+        slo = {**config.get("slo", {}), **scenario.get("slo", {})}
+        results[scenario["name"]] = run(
+            scenario, args.host, args.output, slo, args.interval
+        )
+        time.sleep(5)  # Let the server drain before the next scenario.
+
+    table = report(results)
+    print(table)
+    (args.output / "report.md").write_text(table)
+    (args.output / "report.json").write_text(json.dumps(results, indent=2))
+    if any(summary["missed"] for summary in results.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,1691 @@
 import redis.asyncio as redis
+from redis.crc import REDIS_CLUSTER_HASH_SLOTS, key_slot
 import json
 import numpy as np
 import uvicorn
 from pydantic_settings import BaseSettings
-from fastapi import FastAPI, WebSocket, Request, WebSocketDisconnect
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Query,
+    Response,
+    WebSocket,
+    Request,
+    WebSocketDisconnect,
+)
+from fastapi.responses import StreamingResponse
 from datetime import datetime
 import msgpack
 import asyncio
-from typing import Optional
+import functools
+import gzip
+import itertools
+from typing import Literal, NamedTuple, Optional, get_args
 import socket
-from contextlib import asynccontextmanager
+import struct
+import time
+import uuid
+from bisect import bisect_left
+from collections import ChainMap, OrderedDict, deque
+from contextlib import aclosing, asynccontextmanager
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# What to do with a subscriber that falls behind; see SubscriberQueue.
+QueuePolicy = Literal["block", "drop_oldest", "latest", "disconnect"]
 
 
 class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379/0"
+    # Several servers to shard nodes across (see ShardedStorage) instead of
+    # redis_url; as JSON in the REDIS_URLS environment variable.
+    redis_urls: list[str] = []
     ttl: int = 60 * 60  # 1 hour
+    replay_batch_size: int = 500  # frames fetched per pipelined round trip
+    cache_max_bytes: int = 256 * 1024 * 1024  # encoded messages kept per process
+    cache_ttl: float = 60.0  # seconds
+    # "hash" stores each frame in its own hash and notifies over pub/sub;
+    # "stream" stores each node as a Redis Stream followed with XREAD.
+    storage_backend: Literal["hash", "stream"] = "hash"
+    stream_maxlen: int = 100_000  # approximate cap on entries per stream
+    stream_block_ms: int = 30_000  # longest single blocking XREAD
+    closed_ttl: int = 5 * 60  # frames of a closed node expire this soon
+    max_frames_per_node: int = 0  # oldest frames are trimmed past this; 0 for no cap
+    max_bytes_per_node: int = 0  # the same for payload bytes; hash backend only
+    # Notifications held for a subscriber that falls behind, and what to do once
+    # they run out (see SubscriberQueue); both can be overridden per connection.
+    subscriber_queue_size: int = 1000
+    subscriber_queue_policy: QueuePolicy = "block"
+    # Nodes created with ?compression= only compress frames at least this big.
+    compression_min_bytes: int = 1024
+    # Payloads at least this big in total are compressed, decompressed and
+    # encoded in a worker thread, so that the event loop keeps serving other
+    # sockets meanwhile (zlib, lz4 and zstd release the GIL).
+    codec_thread_bytes: int = 64 * 1024
+    # Uploads split with X-Frame-Size are stored in groups of frames of about
+    # this many bytes, which bounds the memory they take (see ingest_frames).
+    ingest_chunk_bytes: int = 8 * 1024 * 1024
+    # Batches are stored whole, so they are rejected past this size.
+    max_batch_bytes: int = 64 * 1024 * 1024
+    # WebSocket heartbeats: a client that does not answer a ping within the
+    # timeout is disconnected and its subscriptions dropped. These apply to
+    # python server.py; under the uvicorn CLI (as in the Dockerfile), set
+    # UVICORN_WS_PING_INTERVAL and UVICORN_WS_PING_TIMEOUT instead.
+    ws_ping_interval: float = 10.0
+    ws_ping_timeout: float = 10.0
+    # The last frames of each followed node kept in memory per process, to
+    # serve replays and live sends without Redis (see RecentFrames); 0 disables.
+    recent_frames: int = 512
+    recent_frames_max_bytes: int = 256 * 1024 * 1024
+    recent_frames_idle: float = 60.0  # seconds without use before a node is dropped
+
+
+# Allocate the next sequence numbers for a run of frames sharing one metadata,
+# store each frame with a TTL and publish a notification, atomically and in one
+# round trip. A single frame is announced as "seq", several as "first-last",
+# followed by "@now" to time delivery.
+# The node's last activity time is recorded in the index of live nodes.
+# Stored frames are indexed per node as "seq_num:size:time" members scored by
+# seq_num, with a running total of their payload bytes. Entries of frames that
+# have expired are dropped from the front of the index, so that it only covers
+# live frames. The oldest frames are deleted whenever the node holds more than
+# max_frames frames or max_bytes bytes (0 for no limit).
+# KEYS: seq_num counter, live node index, frame index, byte count.
+# ARGV: node_id, now, data key prefix, notify channel, ttl, max_frames,
+#   max_bytes, metadata, payloads...
+APPEND_SCRIPT = """
+local node_id, now, prefix, channel, ttl = unpack(ARGV, 1, 5)
+local max_frames, max_bytes = tonumber(ARGV[6]), tonumber(ARGV[7])
+local metadata = ARGV[8]
+local count = #ARGV - 8
+local last = redis.call("INCRBY", KEYS[1], count)
+local first = last - count + 1
+local added = 0
+for i = 1, count do
+    local seq_num = first + i - 1
+    local payload = ARGV[8 + i]
+    local key = prefix .. seq_num
+    redis.call("HSET", key, "metadata", metadata, "payload", payload)
+    redis.call("EXPIRE", key, ttl)
+    redis.call("ZADD", KEYS[3], seq_num, seq_num .. ":" .. #payload .. ":" .. now)
+    added = added + #payload
+end
+local bytes = redis.call("INCRBY", KEYS[4], added)
+redis.call("EXPIRE", KEYS[3], ttl)
+redis.call("EXPIRE", KEYS[4], ttl)
+local expired = tonumber(now) - tonumber(ttl)
+while true do
+    local oldest = redis.call("ZRANGE", KEYS[3], 0, 0)
+    if #oldest == 0 then
+        break
+    end
+    -- Entries written without a time predate it; drop them too.
+    local _, size, written = string.match(oldest[1], "(%d+):(%d+):?([%d.]*)")
+    if written ~= "" and tonumber(written) > expired then
+        break
+    end
+    redis.call("ZREM", KEYS[3], oldest[1])
+    bytes = redis.call("DECRBY", KEYS[4], size)
+end
+while (max_frames > 0 and redis.call("ZCARD", KEYS[3]) > max_frames)
+        or (max_bytes > 0 and bytes > max_bytes) do
+    local oldest = redis.call("ZPOPMIN", KEYS[3])
+    if #oldest == 0 then
+        break
+    end
+    local seq_num, size = string.match(oldest[1], "(%d+):(%d+)")
+    redis.call("DEL", prefix .. seq_num)
+    bytes = redis.call("DECRBY", KEYS[4], size)
+end
+redis.call("ZADD", KEYS[2], now, node_id)
+if count == 1 then
+    redis.call("PUBLISH", channel, last .. "@" .. now)
+else
+    redis.call("PUBLISH", channel, first .. "-" .. last .. "@" .. now)
+end
+return {first, last}
+"""
+
+# Declare a node done: drop its counter and live listing, and tell subscribers
+# that its sequence numbers start over. Its frame index is moved aside (with a
+# TTL, in case the caller never gets to it) for the caller to shorten the TTL
+# of the frames it lists.
+# KEYS: seq_num counter, live node index, frame index, byte count, new name
+# for the frame index, compression.
+# ARGV: node_id, notify channel, ttl.
+RESET_SCRIPT = """
+redis.call("DEL", KEYS[1], KEYS[4], KEYS[6])
+redis.call("ZREM", KEYS[2], ARGV[1])
+if redis.call("EXISTS", KEYS[3]) == 1 then
+    redis.call("RENAME", KEYS[3], KEYS[5])
+    redis.call("EXPIRE", KEYS[5], ARGV[3])
+end
+redis.call("PUBLISH", ARGV[2], "reset")
+"""
+
+# The same for the stream backend. Entry IDs are "generation-seq_num", where
+# the generation is bumped whenever the node's sequence numbers start over, so
+# that IDs keep increasing. Subscribers follow the stream itself, so nothing
+# is published; entries carry the append time instead.
+# KEYS: seq_num counter, live node index, stream, generation.
+# ARGV: node_id, now, ttl, maxlen, metadata, payloads...
+STREAM_APPEND_SCRIPT = """
+local node_id, now, ttl, maxlen, metadata = unpack(ARGV, 1, 5)
+local count = #ARGV - 5
+local last = redis.call("INCRBY", KEYS[1], count)
+local first = last - count + 1
+local generation = redis.call("GET", KEYS[4])
+if generation then
+    redis.call("EXPIRE", KEYS[4], ttl)
+else
+    generation = "0"
+end
+for i = 1, count do
+    redis.call(
+        "XADD", KEYS[3], "MAXLEN", "~", maxlen, generation .. "-" .. (first + i - 1),
+        "metadata", metadata, "payload", ARGV[5 + i], "time", now
+    )
+end
+redis.call("EXPIRE", KEYS[3], ttl)
+redis.call("ZADD", KEYS[2], now, node_id)
+return {first, last}
+"""
+
+# Read the entries of the current generation with sequence numbers in a range.
+# KEYS: stream, generation. ARGV: first, last.
+STREAM_RANGE_SCRIPT = """
+local generation = redis.call("GET", KEYS[2]) or "0"
+return redis.call(
+    "XRANGE", KEYS[1], generation .. "-" .. ARGV[1], generation .. "-" .. ARGV[2]
+)
+"""
+
+
+def _zstd_compress(data):
+    # Compressor objects must not be shared between threads.
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def _zstd_decompress(data):
+    # Unlike ZstdDecompressor.decompress, this accepts frames that do not
+    # record their content size, as written by streaming compressors.
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+# Payload codecs by Content-Encoding name, as (compress, decompress). gzip is
+# always available, lz4 and zstd if their packages are installed.
+CODECS = {"gzip": (functools.partial(gzip.compress, compresslevel=1), gzip.decompress)}
+if lz4 is not None:
+    CODECS["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+if zstandard is not None:
+    CODECS["zstd"] = (_zstd_compress, _zstd_decompress)
+
+
+def compressed_size(frames):
+    "Total payload bytes of the compressed frames among (payload, metadata) pairs."
+    return sum(
+        len(payload)
+        for payload, metadata in frames
+        if metadata is not None and b'"Content-Encoding"' in metadata
+    )
+
+
+async def iter_frames(chunks, content_type, frame_size=None):
+    """Split a batch upload into its frames as the body arrives.
+
+    chunks is an async iterator of body chunks. application/msgpack bodies
+    are an array of binary payloads, anything else is read as frames each
+    prefixed with a 4-byte big-endian length, or as frames of exactly
+    frame_size bytes back to back if that is given. Frames are yielded as
+    soon as they are complete, so only the frame being received is held in
+    memory.
+    """
+    if content_type == "application/msgpack" and frame_size is None:
+        # Frames can be as large as the msgpack format allows.
+        unpacker = msgpack.Unpacker(max_buffer_size=0)
+        count = None
+        async for chunk in chunks:
+            unpacker.feed(chunk)
+            if count is None:
+                try:
+                    count = unpacker.read_array_header()
+                except msgpack.OutOfData:
+                    continue
+            while count:
+                try:
+                    frame = unpacker.unpack()
+                except msgpack.OutOfData:
+                    break
+                if not isinstance(frame, bytes):
+                    raise ValueError("Expected a msgpack array of binary payloads")
+                count -= 1
+                yield frame
+        if count is None or count:
+            raise ValueError("Truncated batch")
+        return
+    buffer = bytearray()
+    async for chunk in chunks:
+        buffer += chunk
+        offset = 0
+        while True:
+            if frame_size is None:
+                if offset + 4 > len(buffer):
+                    break
+                (length,) = struct.unpack_from("!I", buffer, offset)
+                start = offset + 4
+            else:
+                length, start = frame_size, offset
+            if start + length > len(buffer):
+                break
+            yield bytes(buffer[start : start + length])
+            offset = start + length
+        del buffer[:offset]
+    if buffer:
+        raise ValueError("Truncated frame")
+
+
+def pack_binary_envelope(header, payload):
+    """Frame raw payload bytes for the binary envelope format.
+
+    The layout is a 4-byte big-endian header length, the header as UTF-8 JSON,
+    and then the payload bytes exactly as stored.
+    """
+    header = json.dumps(header).encode("utf-8")
+    return b"".join((struct.pack("!I", len(header)), header, payload))
+
+
+# Payload of the frame that marks the end of a stream
+END_OF_STREAM = json.dumps(None).encode("utf-8")
+
+
+class ViewError(ValueError):
+    "A subscriber's view does not fit the arrays of the node."
+
+
+class View(NamedTuple):
+    """A reduced view of a node's frames, as requested by a subscriber.
+
+    Only every Nth frame is kept, counting from sequence number 1. Arrays are
+    indexed with slices, one per axis, each an index or (start, stop, step).
+    They are then split into bins, each reduced to a single value with reduce
+    ("mean", "min" or "max"); a single bin size applies to every axis, several
+    to the trailing axes.
+    """
+
+    every: int = 1
+    slices: tuple = ()
+    bins: tuple = ()
+    reduce: str = "mean"
+
+    @classmethod
+    def parse(cls, every=1, slices=None, bins=None, reduce="mean"):
+        """Build a View from query parameters such as "0:100,::2" and "4,4".
+
+        Returns None for the full view, and raises ValueError if malformed.
+        """
+        parsed = []
+        for part in slices.split(",") if slices else ():
+            bounds = [
+                int(bound) if bound.strip() else None for bound in part.split(":")
+            ]
+            if len(bounds) == 1 and bounds[0] is not None:
+                parsed.append(bounds[0])
+            elif 2 <= len(bounds) <= 3:
+                if len(bounds) == 3 and bounds[2] == 0:
+                    raise ValueError(f"Invalid slice {part!r}: step cannot be zero")
+                parsed.append(tuple(bounds))
+            else:
+                raise ValueError(f"Invalid slice {part!r}")
+        bins = tuple(int(size) for size in bins.split(",")) if bins else ()
+        if every < 1 or any(size < 1 for size in bins):
+            raise ValueError("every and bin sizes must be positive")
+        if reduce not in ("mean", "min", "max"):
+            raise ValueError(f"Invalid reduce {reduce!r}")
+        if every == 1 and not parsed and not bins:
+            return None
+        return cls(every, tuple(parsed), bins, reduce)
+
+    @property
+    def transforms(self):
+        "Whether arrays are changed, rather than whole frames skipped."
+        return bool(self.slices or self.bins)
+
+    def keeps(self, seq_num):
+        return (seq_num - 1) % self.every == 0
+
+    def apply(self, array):
+        "Reduce an array, raising ViewError if the slices do not fit it."
+        try:
+            return self._apply(array)
+        except (IndexError, ValueError) as e:
+            raise ViewError(f"Invalid view for shape {list(array.shape)}: {e}") from e
+
+    def _apply(self, array):
+        if self.slices:
+            index = tuple(
+                slice(*bounds) if isinstance(bounds, tuple) else bounds
+                for bounds in self.slices
+            )
+            array = array[index[: array.ndim]]
+        if self.bins and array.ndim:
+            if len(self.bins) == 1:
+                sizes = self.bins * array.ndim
+            else:
+                sizes = (1,) * (array.ndim - len(self.bins)) + self.bins[-array.ndim :]
+            sizes = [max(1, min(size, n)) for size, n in zip(sizes, array.shape)]
+            # Drop the remainders, then reduce each bin along its own axes.
+            array = array[
+                tuple(slice(0, n - n % size) for size, n in zip(sizes, array.shape))
+            ]
+            shape = []
+            for size, n in zip(sizes, array.shape):
+                shape += [n // size, size]
+            array = getattr(array.reshape(shape), self.reduce)(
+                axis=tuple(range(1, 2 * array.ndim, 2))
+            )
+        return array
+
+
+def decode_array(payload, metadata):
+    """Read a payload as an array of the dtype and shape declared in metadata.
+
+    Payloads without a declaration are read as 1-d float64 arrays, as they
+    were before producers could declare them, unless their size does not
+    allow it. Then None is returned.
+    """
+    dtype = metadata.get("dtype")
+    if dtype is not None:
+        return np.frombuffer(payload, dtype=dtype).reshape(metadata["shape"])
+    if len(payload) % 8 == 0:
+        return np.frombuffer(payload, dtype=np.float64)
+    return None
+
+
+def encode_message(
+    node_id, seq_num, payload, metadata, envelope_format, compressed=False, view=None
+):
+    """Encode a frame read from Redis for the wire.
+
+    Returns (message, end_of_stream). The message is None if the frame
+    does not exist or is not part of the view, bytes for msgpack and binary,
+    and str otherwise.
+
+    The binary format skips decoding altogether: the header carries the
+    dtype and shape, and the payload is sent exactly as stored.
+
+    Compressed payloads are decompressed, unless compressed is true and the
+    format can carry bytes (msgpack and binary): then they are passed through
+    as stored and the envelope names their content_encoding. Views that
+    change arrays always need them decompressed.
+    """
+    if payload is None and metadata is None:
+        return None, False
+    if view is not None and not view.keeps(seq_num) and payload != END_OF_STREAM:
+        return None, False
+    fields = json.loads(metadata)
+    content_encoding = fields.get("Content-Encoding")
+    if content_encoding is not None and (
+        not compressed
+        or envelope_format == "json"
+        or (view is not None and view.transforms)
+    ):
+        payload = CODECS[content_encoding][1](payload)
+        content_encoding = None
+    if content_encoding is not None:
+        data = {
+            "node_id": node_id,
+            "sequence": seq_num,
+            "metadata": metadata.decode("utf-8"),
+            "content_encoding": content_encoding,
+            "server_host": socket.gethostname(),
+        }
+        if envelope_format == "binary":
+            # Without a declared shape, the length is only known once
+            # decompressed.
+            data.update(
+                dtype=fields.get("dtype", np.dtype(np.float64).str),
+                shape=fields.get("shape", [-1]),
+            )
+            return pack_binary_envelope(data, payload), False
+        data["payload"] = payload
+        return msgpack.packb(data), False
+    array = decode_array(payload, fields)
+    if array is None:
+        value = json.loads(payload)
+        end_of_stream = value is None
+    else:
+        end_of_stream = False
+        if view is not None and view.transforms:
+            array = view.apply(array)
+            payload = array.tobytes()
+    if envelope_format == "binary":
+        header = {
+            "node_id": node_id,
+            "sequence": seq_num,
+            "metadata": metadata.decode("utf-8"),
+            "dtype": array.dtype.str if array is not None else None,
+            "shape": list(array.shape) if array is not None else None,
+            "server_host": socket.gethostname(),
+        }
+        return pack_binary_envelope(header, payload), end_of_stream
+    data = {
+        "node_id": node_id,
+        "sequence": seq_num,
+        "metadata": metadata.decode("utf-8"),
+        "payload": array.tolist() if array is not None else value,
+        "server_host": socket.gethostname(),
+    }
+    if envelope_format == "msgpack":
+        return msgpack.packb(data), end_of_stream
+    return json.dumps(data), end_of_stream
+
+
+RangeFormat = Literal["binary", "ndjson", "msgpack"]
+
+RANGE_MEDIA_TYPES = {
+    "binary": "application/octet-stream",
+    "ndjson": "application/x-ndjson",
+    "msgpack": "application/msgpack",
+}
+
+
+def encode_range(node_id, frames, range_format, concat=False):
+    """Encode (seq_num, payload, metadata) frames read for a range request.
+
+    Missing frames are left out. The frames are encoded as by encode_message,
+    in range_format:
+
+    - binary: binary envelopes, each prefixed with its 4-byte big-endian
+      length as in batch uploads
+    - ndjson: JSON envelopes, one per line
+    - msgpack: msgpack envelopes back to back, to be read with an Unpacker
+
+    With concat (binary only), consecutive arrays of the same dtype and shape
+    are sent as one envelope: the arrays back to back, with a shape of
+    [count, *shape] and "sequences" and "metadata" listing each frame's.
+    """
+    envelope_format = "json" if range_format == "ndjson" else range_format
+    chunks = []
+    run = []  # (seq_num, metadata, array) of arrays to concatenate
+
+    def add(message):
+        if range_format == "binary":
+            chunks.append(struct.pack("!I", len(message)))
+        elif range_format == "ndjson":
+            message = message.encode("utf-8") + b"\n"
+        chunks.append(message)
+
+    def flush():
+        if not run:
+            return
+        array = run[0][2]
+        header = {
+            "node_id": node_id,
+            "sequences": [seq_num for seq_num, _, _ in run],
+            "metadata": [metadata.decode("utf-8") for _, metadata, _ in run],
+            "dtype": array.dtype.str,
+            "shape": [len(run), *array.shape],
+            "server_host": socket.gethostname(),
+        }
+        add(
+            pack_binary_envelope(header, b"".join(array.tobytes() for *_, array in run))
+        )
+        run.clear()
+
+    for seq_num, payload, metadata in frames:
+        if payload is None and metadata is None:
+            continue
+        if concat:
+            fields = json.loads(metadata)
+            content_encoding = fields.get("Content-Encoding")
+            if content_encoding is not None:
+                payload = CODECS[content_encoding][1](payload)
+            array = decode_array(payload, fields)
+            if array is not None:
+                if run and (run[0][2].dtype, run[0][2].shape) != (
+                    array.dtype,
+                    array.shape,
+                ):
+                    flush()
+                run.append((seq_num, metadata, array))
+                continue
+            flush()
+        message, _ = encode_message(
+            node_id, seq_num, payload, metadata, envelope_format
+        )
+        add(message)
+    flush()
+    return b"".join(chunks)
+
+
+class MessageCache:
+    """Encoded messages shared by all subscribers in this process.
+
+    Entries are keyed by (node_id, seq_num, encoding), where encoding is the
+    tuple of encode_message options after the frame, and hold the
+    (message, end_of_stream) pair returned by encode_message. The cache is
+    bounded by the total size of the messages, evicting the least recently
+    used first, and entries expire ttl seconds after they were stored.
+    Concurrent requests for the same entry share a single fetch and encode.
+    If the request doing it is cancelled, the others load the entry again.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.size = 0
+        # key -> (expires_at, size, value), least recently used first
+        self._entries = OrderedDict()
+        # key -> Future resolved by the request that is loading it
+        self._loading = {}
+        # node_id -> keys of that node, for discard()
+        self._keys_by_node = {}
+        # node_id -> count of discards, to reject loads that straddle one
+        self._generation = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get_many(self, keys, load):
+        """Return the values for keys, in order.
+
+        load is called with the keys that are neither cached nor already being
+        loaded, and must return their values in the same order. Values whose
+        message is None (missing frames) are returned but not cached.
+        """
+        results = {}
+        waiting = {}
+        missing = []
+        now = time.monotonic()
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                results[key] = entry[2]
+                self.hits += 1
+            elif key in self._loading:
+                waiting[key] = self._loading[key]
+                self.hits += 1
+            else:
+                missing.append(key)
+                self.misses += 1
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._loading.update(futures)
+            generations = {key[0]: self._generation.get(key[0], 0) for key in missing}
+            try:
+                values = await load(missing)
+            except BaseException as e:
+                for key, future in futures.items():
+                    self._loading.pop(key, None)
+                    if isinstance(e, asyncio.CancelledError):
+                        # Only this caller was cancelled; the waiters retry.
+                        future.cancel()
+                    else:
+                        future.set_exception(e)
+                        future.exception()  # Mark retrieved; the caller re-raises.
+                raise
+            for key, value in zip(missing, values):
+                self._loading.pop(key, None)
+                futures[key].set_result(value)
+                results[key] = value
+                if generations[key[0]] == self._generation.get(key[0], 0):
+                    self._store(key, value)
+        retry = []
+        for key, future in waiting.items():
+            # Unlike awaiting the future, wait() does not propagate its
+            # cancellation to this task.
+            await asyncio.wait([future])
+            if future.cancelled():
+                retry.append(key)
+            else:
+                results[key] = future.result()
+        if retry:
+            results.update(zip(retry, await self.get_many(retry, load)))
+        return [results[key] for key in keys]
+
+    def discard(self, node_id):
+        "Drop every entry for node_id, including any load in progress."
+        self._generation[node_id] = self._generation.get(node_id, 0) + 1
+        for key in self._keys_by_node.pop(node_id, ()):
+            self._remove(key, forget=False)
+
+    def _store(self, key, value):
+        message = value[0]
+        if message is None:
+            return
+        size = len(message)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, value)
+        self._keys_by_node.setdefault(key[0], set()).add(key)
+        self.size += size
+        while self.size > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+
+    def _remove(self, key, forget=True):
+        _, size, _ = self._entries.pop(key)
+        self.size -= size
+        if forget:
+            keys = self._keys_by_node.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_node[key[0]]
+
+
+class FrameRing:
+    "The last size frames of one node, in slots indexed by seq_num % size."
+
+    def __init__(self, size):
+        self.slots = [None] * size
+        self.latest = 0
+        self.nbytes = 0
+        self.used = time.monotonic()
+
+    def put(self, seq_num, frame):
+        """Store a frame, returning the change in bytes held.
+
+        Frames older than the window ending at the latest are ignored.
+        """
+        size = len(self.slots)
+        if seq_num <= self.latest - size:
+            return 0
+        index = seq_num % size
+        old = self.slots[index]
+        added = len(frame[0]) + len(frame[1])
+        if old is not None:
+            added -= len(old[1][0]) + len(old[1][1])
+        self.slots[index] = (seq_num, frame)
+        self.latest = max(self.latest, seq_num)
+        self.nbytes += added
+        return added
+
+    def get(self, seq_num):
+        entry = self.slots[seq_num % len(self.slots)]
+        if entry is None or entry[0] != seq_num:
+            return None
+        if seq_num <= self.latest - len(self.slots):
+            return None
+        return entry[1]
+
+
+class RecentFrames:
+    """The most recent frames of the nodes this process follows, in memory.
+
+    Each node gets a FrameRing of the last size (payload, metadata) frames as
+    stored, filled from the frames appended or fetched by this process and
+    the entries read by the StreamHub, so that late joiners and reconnecting
+    subscribers replay the recent past without reading Redis. Only nodes
+    followed by the hub are kept, since a reset is only noticed through it;
+    discard() drops a node when it is reset or no longer followed. Nodes
+    unused for idle_ttl seconds are dropped, and the least recently used
+    ones whenever the total exceeds max_bytes.
+
+    put() takes the generation read before the frames were loaded, so that
+    frames loaded across a discard are not stored.
+    """
+
+    def __init__(self, size, max_bytes, idle_ttl):
+        self.size = size
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self.generation = 0
+        # node_id -> FrameRing, least recently used first
+        self._rings = OrderedDict()
+
+    def __len__(self):
+        return len(self._rings)
+
+    def get(self, node_id, seq_nums):
+        "Return the frames held for seq_nums, in order, with None for the rest."
+        self._evict()
+        ring = self._rings.get(node_id)
+        if ring is None:
+            frames = [None] * len(seq_nums)
+        else:
+            ring.used = time.monotonic()
+            self._rings.move_to_end(node_id)
+            frames = [ring.get(seq_num) for seq_num in seq_nums]
+        hits = sum(frame is not None for frame in frames)
+        self.hits += hits
+        self.misses += len(frames) - hits
+        return frames
+
+    def put(self, node_id, frames, generation=None):
+        "Store (seq_num, (payload, metadata)) pairs for node_id."
+        if not self.size or (generation is not None and generation != self.generation):
+            return
+        ring = self._rings.get(node_id)
+        if ring is None:
+            ring = self._rings[node_id] = FrameRing(self.size)
+        else:
+            ring.used = time.monotonic()
+            self._rings.move_to_end(node_id)
+        for seq_num, frame in frames:
+            if frame[0] is not None:
+                self.nbytes += ring.put(seq_num, frame)
+        self._evict()
+
+    def discard(self, node_id):
+        self.generation += 1
+        ring = self._rings.pop(node_id, None)
+        if ring is not None:
+            self.nbytes -= ring.nbytes
+
+    def _evict(self):
+        idle_since = time.monotonic() - self.idle_ttl
+        while self._rings:
+            node_id, ring = next(iter(self._rings.items()))
+            if ring.used >= idle_since and self.nbytes <= self.max_bytes:
+                break
+            del self._rings[node_id]
+            self.nbytes -= ring.nbytes
+
+
+def node_key(kind, node_id, *suffix):
+    """Name the Redis key (or channel) of a kind for node_id.
+
+    The node_id is a hash tag, as in "data:{42}:7", so that all the keys of a
+    node share one Redis Cluster slot and a single shard, keeping its scripts
+    and pipelines on one server.
+    """
+    return ":".join((kind, f"{{{node_id}}}", *map(str, suffix)))
+
+
+def node_of_key(key):
+    "The node_id in a key named by node_key."
+    return key.split("{", 1)[1].split("}", 1)[0]
+
+
+QUEUE_POLICIES = get_args(QueuePolicy)
+
+# Close code for a subscriber cut off by the "disconnect" policy. The close
+# reason is JSON giving the last sequence number delivered, to resume from.
+SLOW_CONSUMER_CLOSE_CODE = 4000
+
+
+class SlowConsumer(Exception):
+    "The subscriber fell too far behind under the disconnect policy."
+
+
+class SubscriberStats:
+    "Counters shared by the subscriber queues of one app."
+
+    def __init__(self):
+        self.dropped = 0  # notifications discarded from a full queue
+        self.coalesced = 0  # notifications superseded under the latest policy
+        self.disconnected = 0  # subscribers cut off for falling behind
+
+
+class SubscriberQueue:
+    """Bounded queue of the sequence numbers announced to one subscriber.
+
+    Subscribers send every frame up to each sequence number they take from
+    the queue, reading missed frames back from Redis. When a slow subscriber
+    lets the queue fill up, the policy decides what happens:
+
+    block: nothing is lost; new sequence numbers are merged into the last
+        one queued and the subscriber catches up at its own pace.
+    drop_oldest: the oldest sequence number is dropped, and the subscriber
+        skips ahead to the next one queued.
+    latest: only the newest sequence number is kept, whatever the size, so
+        the subscriber always skips ahead to the newest frame.
+    disconnect: get raises SlowConsumer.
+
+    A reset (None) supersedes everything queued before it and is never
+    dropped. get returns (item, skip), where skip tells the subscriber that
+    frames before item were dropped and must not be sent.
+    """
+
+    def __init__(self, maxsize, policy="block", stats=None):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"Unknown queue policy {policy!r}")
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.stats = stats if stats is not None else SubscriberStats()
+        self.overflowed = False
+        self._items = deque()
+        self._skip = False
+        self._ready = asyncio.Event()
+
+    def qsize(self):
+        return len(self._items)
+
+    def put_nowait(self, item):
+        items = self._items
+        if item is None:
+            items.clear()
+            items.append(None)
+            self._skip = False
+        elif self.overflowed:
+            return
+        elif self.policy == "latest" and items and items[-1] is not None:
+            items[-1] = item
+            self._skip = True
+            self.stats.coalesced += 1
+        elif len(items) < self.maxsize or items[-1] is None:
+            items.append(item)
+        elif self.policy == "block":
+            items[-1] = max(items[-1], item)
+        elif self.policy == "drop_oldest":
+            # A queued reset is always first; keep it.
+            del items[1 if items[0] is None else 0]
+            items.append(item)
+            self._skip = True
+            self.stats.dropped += 1
+        else:
+            self.overflowed = True
+            self.stats.disconnected += 1
+        self._ready.set()
+
+    def get_nowait(self):
+        if self.overflowed:
+            raise SlowConsumer
+        if not self._items:
+            raise asyncio.QueueEmpty
+        item = self._items.popleft()
+        if item is None:
+            # Anything dropped came after the reset.
+            return None, False
+        skip, self._skip = self._skip, False
+        return item, skip
+
+    async def get(self):
+        while not self._items and not self.overflowed:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.get_nowait()
+
+
+class NotificationHub:
+    """Fan out Redis notifications to every local subscriber of a node.
+
+    A single pubsub connection is shared by the whole worker process. The
+    channel for a node is subscribed when its first local subscriber arrives
+    and unsubscribed when the last one leaves. Each sequence number published
+    on the channel is put on the queue of every local subscriber.
+
+    A "reset" notification, published when a node is closed and its sequence
+    numbers start over, is delivered to subscribers as None. Callables in
+    release_callbacks are called with the node_id whenever a node is reset or
+    this process stops following it, so that local caches can be dropped.
+    Callables in frame_callbacks are called with a node_id and a list of
+    (seq_num, (payload, metadata)) frames read along with the notifications,
+    which only the StreamHub has.
+
+    published maps each node_id to the last sequence number announced and the
+    time it was appended, for measuring delivery latency.
+    """
+
+    subscribe_timeout = 10.0  # seconds to wait for Redis to confirm a channel
+
+    def __init__(self, redis_client):
+        self._redis_client = redis_client
+        self.release_callbacks = []
+        self.frame_callbacks = []
+        self.published = {}
+        self._pubsub = None
+        self._listener = None
+        self._lock = asyncio.Lock()
+        # node_id -> set of subscriber queues
+        self._subscribers = {}
+        # channel -> Event set once Redis confirms the subscription
+        self._pending = {}
+
+    @property
+    def subscriptions(self):
+        "Number of node channels this process is subscribed to."
+        return len(self._subscribers)
+
+    def follows(self, node_id):
+        "Whether this process is following node_id for local subscribers."
+        return node_id in self._subscribers
+
+    def queue_depths(self):
+        "Number of notifications waiting in each local subscriber queue."
+        return [
+            queue.qsize() for queues in self._subscribers.values() for queue in queues
+        ]
+
+    async def subscribe(self, node_id, queue=None):
+        """Register a queue for notifications about node_id.
+
+        Returns once Redis has confirmed the subscription, so that anything
+        published after this call is guaranteed to reach the queue. If the
+        subscription fails or is not confirmed within subscribe_timeout, the
+        error is raised and the node is left as if never subscribed.
+        """
+        if queue is None:
+            queue = asyncio.Queue()
+        async with self._lock:
+            queues = self._subscribers.get(node_id)
+            if queues is not None:
+                queues.add(queue)
+                return queue
+            channel = node_key("notify", node_id)
+            confirmed = self._pending[channel] = asyncio.Event()
+            if self._pubsub is None:
+                self._pubsub = self._redis_client.pubsub()
+            try:
+                async with asyncio.timeout(self.subscribe_timeout):
+                    await self._pubsub.subscribe(channel)
+                    if self._listener is None:
+                        self._listener = asyncio.create_task(self._listen())
+                    await confirmed.wait()
+            except BaseException:
+                self._pending.pop(channel, None)
+                try:
+                    # In case Redis subscribed after all
+                    await self._pubsub.unsubscribe(channel)
+                except Exception:
+                    pass
+                raise
+            self._subscribers[node_id] = {queue}
+        return queue
+
+    async def unsubscribe(self, node_id, queue):
+        "Remove a queue, dropping the Redis subscription if it was the last one."
+        async with self._lock:
+            queues = self._subscribers.get(node_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[node_id]
+                await self._pubsub.unsubscribe(node_key("notify", node_id))
+                self._release(node_id)
+
+    def _release(self, node_id):
+        self.published.pop(node_id, None)
+        for callback in self.release_callbacks:
+            callback(node_id)
+
+    async def _listen(self):
+        while True:
+            try:
+                message = await self._pubsub.get_message(timeout=None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The pubsub client reconnects and resubscribes on its own.
+                print(f"Live subscription error: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            channel = message["channel"].decode("utf-8")
+            if message["type"] == "subscribe":
+                confirmed = self._pending.pop(channel, None)
+                if confirmed is not None:
+                    confirmed.set()
+            elif message["type"] == "message":
+                node_id = node_of_key(channel)
+                if message["data"] == b"reset":
+                    self._release(node_id)
+                    live_seqs = (None,)
+                else:
+                    try:
+                        # A batch append announces its range as "first-last".
+                        # Subscribers catch up to the last sequence number, so
+                        # the first and last are enough.
+                        seqs, _, appended_at = message["data"].partition(b"@")
+                        first, _, last = seqs.partition(b"-")
+                        live_seqs = (int(first), int(last)) if last else (int(first),)
+                    except Exception as e:
+                        print(f"Error parsing live message: {e}")
+                        continue
+                    if appended_at:
+                        self.published[node_id] = (live_seqs[-1], float(appended_at))
+                for queue in self._subscribers.get(node_id, ()):
+                    for live_seq in live_seqs:
+                        queue.put_nowait(live_seq)
+
+    async def aclose(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+
+class StreamHub(NotificationHub):
+    """Fan out new stream entries to every local subscriber of a node.
+
+    This is the NotificationHub of the stream backend. A single task per
+    worker process follows the streams of all nodes with local subscribers
+    with a blocking XREAD from a cursor, so a connection blip delays
+    notifications but never loses them. Subscribers see the same sequence
+    numbers and resets as with NotificationHub.
+
+    The XREAD also follows a wake-up stream of this hub. Following a new
+    node adds an entry to it, so that the blocked read returns and is issued
+    again with the new node; cancelling it instead would make redis-py drop
+    the connection.
+    """
+
+    def __init__(self, redis_client, block_ms):
+        self._redis_client = redis_client
+        self._block_ms = block_ms
+        self.release_callbacks = []
+        self.frame_callbacks = []
+        self.published = {}
+        self._reader = None
+        self._lock = asyncio.Lock()
+        # node_id -> set of subscriber queues
+        self._subscribers = {}
+        # node_id -> ID of the last entry seen
+        self._cursors = {}
+        # Set when the first stream is followed, to start reading again
+        self._changed = asyncio.Event()
+        self._wake_key = f"stream_hub:{uuid.uuid4().hex}"
+        self._wake_cursor = b"0-0"
+
+    @property
+    def subscriptions(self):
+        "Number of node streams this process is following."
+        return len(self._subscribers)
+
+    async def subscribe(self, node_id, queue=None):
+        """Register a queue for new entries of node_id.
+
+        The cursor starts at the last entry present when this is called, so
+        that anything appended afterwards is guaranteed to reach the queue.
+        """
+        if queue is None:
+            queue = asyncio.Queue()
+        async with self._lock:
+            queues = self._subscribers.get(node_id)
+            if queues is not None:
+                queues.add(queue)
+                return queue
+            pipeline = self._redis_client.pipeline(transaction=False)
+            pipeline.xrevrange(node_key("stream", node_id), count=1)
+            # Wake the reader up to follow this stream too.
+            pipeline.xadd(self._wake_key, {"node_id": node_id}, maxlen=1)
+            pipeline.expire(self._wake_key, 60 + self._block_ms // 1000)
+            last, *_ = await pipeline.execute()
+            self._cursors[node_id] = last[0][0] if last else b"0-0"
+            self._subscribers[node_id] = {queue}
+            self._changed.set()
+            if self._reader is None:
+                self._reader = asyncio.create_task(self._read())
+        return queue
+
+    async def unsubscribe(self, node_id, queue):
+        "Remove a queue, no longer following the stream if it was the last one."
+        async with self._lock:
+            queues = self._subscribers.get(node_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                # The reader skips the stream from now on, and stops
+                # following it the next time it calls XREAD.
+                del self._subscribers[node_id]
+                del self._cursors[node_id]
+                self._release(node_id)
+
+    async def _read(self):
+        while True:
+            while not self._cursors:
+                # The last stream may have been dropped since the event was set.
+                self._changed.clear()
+                await self._changed.wait()
+            streams = {
+                node_key("stream", node_id): cursor
+                for node_id, cursor in self._cursors.items()
+            }
+            streams[self._wake_key] = self._wake_cursor
+            try:
+                response = await self._redis_client.xread(streams, block=self._block_ms)
+            except Exception as e:
+                print(f"Live subscription error: {e}")
+                await asyncio.sleep(1)
+                continue
+            for stream, entries in response or ():
+                stream = stream.decode("utf-8")
+                if stream == self._wake_key:
+                    self._wake_cursor = entries[-1][0]
+                    continue
+                node_id = node_of_key(stream)
+                cursor = self._cursors.get(node_id)
+                if cursor is None:
+                    continue  # Unsubscribed meanwhile
+                generation = cursor.split(b"-")[0]
+                frames = []
+                for entry_id, fields in entries:
+                    entry_generation, live_seq = entry_id.split(b"-")
+                    if entry_generation != generation:
+                        # The node's sequence numbers started over.
+                        generation = entry_generation
+                        frames = []
+                        self._release(node_id)
+                        self._deliver(node_id, None)
+                    live_seq = int(live_seq)
+                    if b"time" in fields:
+                        self.published[node_id] = (live_seq, float(fields[b"time"]))
+                    frames.append((live_seq, (fields[b"payload"], fields[b"metadata"])))
+                    self._deliver(node_id, live_seq)
+                self._cursors[node_id] = entries[-1][0]
+                for callback in self.frame_callbacks:
+                    callback(node_id, frames)
+
+    def _deliver(self, node_id, live_seq):
+        for queue in self._subscribers.get(node_id, ()):
+            queue.put_nowait(live_seq)
+
+    async def aclose(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+            self._reader = None
+
+
+# Sorted set of live node_ids, scored by the time of their last activity
+LIVE_NODES = "live_nodes"
+
+
+class HashStorage:
+    """Store each frame in its own data:{node_id}:{seq_num} hash with a TTL.
+
+    Subscribers are notified over pub/sub by a NotificationHub.
+    """
+
+    scripts = (APPEND_SCRIPT, RESET_SCRIPT)
+
+    def __init__(self, redis_client, settings):
+        self._redis_client = redis_client
+        self._settings = settings
+        self._append_script = redis_client.register_script(APPEND_SCRIPT)
+        self._reset_script = redis_client.register_script(RESET_SCRIPT)
+
+    def make_hub(self):
+        return NotificationHub(self._redis_client)
+
+    async def load_scripts(self):
+        "Load the Lua scripts so that later calls only send their SHA."
+        for script in self.scripts:
+            await self._redis_client.script_load(script)
+
+    async def current_seq(self, node_id):
+        "The last sequence number allocated for node_id, or 0."
+        current_seq = await self._redis_client.get(node_key("seq_num", node_id))
+        return int(current_seq) if current_seq is not None else 0
+
+    async def create(self, node_id, compression=None):
+        """Allocate a counter for node_id and list it as live.
+
+        compression names the codec the server applies to the node's frames.
+        """
+        pipeline = self._redis_client.pipeline()
+        pipeline.setnx(node_key("seq_num", node_id), 0)
+        pipeline.zadd(LIVE_NODES, {node_id: time.time()})
+        if compression is not None:
+            pipeline.set(node_key("compression", node_id), compression)
+        else:
+            pipeline.delete(node_key("compression", node_id))
+        await pipeline.execute()
+
+    async def compression(self, node_id):
+        "The codec node_id was created with, or None."
+        compression = await self._redis_client.get(node_key("compression", node_id))
+        return compression.decode("utf-8") if compression is not None else None
+
+    async def list_nodes(self, cursor, count, stats):
+        """Page through the index of live nodes.
+
+        Returns the next cursor (0 once the scan is complete) and the node_ids
+        found, or dicts with each node's latest sequence number and last write
+        time if stats is true. As with SCAN, a page may hold more or fewer
+        than count nodes.
+        """
+        cursor, entries = await self._redis_client.zscan(
+            LIVE_NODES, cursor, count=count
+        )
+        node_ids = [member.decode("utf-8") for member, _ in entries]
+        if not stats:
+            return cursor, node_ids
+        pipeline = self._redis_client.pipeline(transaction=False)
+        for node_id in node_ids:
+            pipeline.get(node_key("seq_num", node_id))
+        latest = await pipeline.execute()
+        return cursor, [
+            {
+                "node_id": node_id,
+                "latest_seq": int(seq_num) if seq_num is not None else 0,
+                "last_write": datetime.fromtimestamp(score).isoformat(),
+            }
+            for node_id, (_, score), seq_num in zip(node_ids, entries, latest)
+        ]
+
+    async def append(self, node_id, metadata, payloads):
+        """Store payloads as consecutive frames sharing metadata (as bytes).
+
+        Sequence numbers are allocated, frames stored and subscribers notified
+        atomically, so a sequence number is either fully written or not
+        allocated at all. The node's oldest frames are trimmed to stay within
+        the per-node caps. Returns the first and last sequence numbers.
+        """
+        first, last = await self._append_script(
+            keys=[
+                node_key("seq_num", node_id),
+                LIVE_NODES,
+                node_key("frames", node_id),
+                node_key("bytes", node_id),
+            ],
+            args=[
+                node_id,
+                time.time(),
+                node_key("data", node_id) + ":",
+                node_key("notify", node_id),
+                self._settings.ttl,
+                self._settings.max_frames_per_node,
+                self._settings.max_bytes_per_node,
+                metadata,
+                *payloads,
+            ],
+        )
+        return first, last
+
+    async def fetch(self, node_id, seq_nums):
+        "Return (payload, metadata) for each sequence number, or Nones if missing."
+        pipeline = self._redis_client.pipeline(transaction=False)
+        for seq_num in seq_nums:
+            pipeline.hmget(node_key("data", node_id, seq_num), "payload", "metadata")
+        return await pipeline.execute()
+
+    async def reset(self, node_id):
+        """Declare a node done; its sequence numbers start over if it is reused.
+
+        The frames written so far expire within Settings.closed_ttl.
+        """
+        closing = node_key("frames", node_id, "closing", uuid.uuid4().hex)
+        await self._reset_script(
+            keys=[
+                node_key("seq_num", node_id),
+                LIVE_NODES,
+                node_key("frames", node_id),
+                node_key("bytes", node_id),
+                closing,
+                node_key("compression", node_id),
+            ],
+            args=[node_id, node_key("notify", node_id), self._settings.ttl],
+        )
+        # Shorten the TTL of the frames listed in the index we moved aside, a
+        # batch at a time so as not to block Redis on long-lived nodes.
+        while entries := await self._redis_client.zpopmin(
+            closing, self._settings.replay_batch_size
+        ):
+            pipeline = self._redis_client.pipeline(transaction=False)
+            for member, _ in entries:
+                seq_num = member.split(b":")[0].decode("utf-8")
+                pipeline.expire(
+                    node_key("data", node_id, seq_num),
+                    self._settings.closed_ttl,
+                    lt=True,
+                )
+            await pipeline.execute()
+
+
+class StreamStorage(HashStorage):
+    """Store each node as a stream:{node_id} Redis Stream.
+
+    Entries are trimmed to about Settings.max_frames_per_node per node, or
+    Settings.stream_maxlen if that is not set, and the stream expires
+    Settings.ttl after the last append. Frames are read with one XRANGE per
+    run of consecutive sequence numbers, and subscribers follow the streams
+    with a StreamHub.
+    """
+
+    scripts = (STREAM_APPEND_SCRIPT, STREAM_RANGE_SCRIPT)
+
+    def __init__(self, redis_client, settings):
+        if settings.max_bytes_per_node:
+            raise ValueError("max_bytes_per_node is not supported by streams")
+        self._redis_client = redis_client
+        self._settings = settings
+        self._append_script = redis_client.register_script(STREAM_APPEND_SCRIPT)
+        self._range_script = redis_client.register_script(STREAM_RANGE_SCRIPT)
+
+    def make_hub(self):
+        return StreamHub(self._redis_client, self._settings.stream_block_ms)
+
+    async def append(self, node_id, metadata, payloads):
+        first, last = await self._append_script(
+            keys=[
+                node_key("seq_num", node_id),
+                LIVE_NODES,
+                node_key("stream", node_id),
+                node_key("generation", node_id),
+            ],
+            args=[
+                node_id,
+                time.time(),
+                self._settings.ttl,
+                self._settings.max_frames_per_node or self._settings.stream_maxlen,
+                metadata,
+                *payloads,
+            ],
+        )
+        return first, last
+
+    async def fetch(self, node_id, seq_nums):
+        seq_nums = list(seq_nums)
+        if not seq_nums:
+            return []
+        # Only the frames asked for are read, even when they are sparse.
+        runs = []
+        for seq_num in sorted(set(seq_nums)):
+            if runs and runs[-1][1] == seq_num - 1:
+                runs[-1][1] = seq_num
+            else:
+                runs.append([seq_num, seq_num])
+        pipeline = self._redis_client.pipeline()
+        for first, last in runs:
+            await self._range_script(
+                keys=[node_key("stream", node_id), node_key("generation", node_id)],
+                args=[first, last],
+                client=pipeline,
+            )
+        frames = {}
+        for entry_id, fields in itertools.chain(*await pipeline.execute()):
+            fields = dict(zip(fields[::2], fields[1::2]))
+            frames[int(entry_id.split(b"-")[1])] = [
+                fields[b"payload"],
+                fields[b"metadata"],
+            ]
+        return [frames.get(seq_num, [None, None]) for seq_num in seq_nums]
+
+    async def reset(self, node_id):
+        # Entries already written expire with the stream, within closed_ttl
+        # unless the node is reused; new ones get a later generation so that
+        # their IDs keep increasing.
+        pipeline = self._redis_client.pipeline()
+        pipeline.delete(node_key("seq_num", node_id), node_key("compression", node_id))
+        pipeline.zrem(LIVE_NODES, node_id)
+        pipeline.incr(node_key("generation", node_id))
+        pipeline.expire(node_key("generation", node_id), self._settings.ttl)
+        pipeline.expire(node_key("stream", node_id), self._settings.closed_ttl, lt=True)
+        await pipeline.execute()
+
+
+STORAGE_BACKENDS = {"hash": HashStorage, "stream": StreamStorage}
+
+
+class ShardedStorage:
+    """Spread nodes across several Redis servers, each holding whole nodes.
+
+    A node lives on the shard owning its Redis Cluster hash slot, with slots
+    split evenly between shards, so its scripts, pipelines and pub/sub stay
+    on one server. Each shard keeps its own index of live nodes.
+    """
+
+    def __init__(self, shards):
+        self.shards = shards
+
+    def shard_index(self, node_id):
+        return (
+            key_slot(str(node_id).encode())
+            * len(self.shards)
+            // REDIS_CLUSTER_HASH_SLOTS
+        )
+
+    def shard(self, node_id):
+        return self.shards[self.shard_index(node_id)]
+
+    def make_hub(self):
+        return ShardedHub([shard.make_hub() for shard in self.shards], self.shard_index)
+
+    async def load_scripts(self):
+        await asyncio.gather(*(shard.load_scripts() for shard in self.shards))
+
+    async def current_seq(self, node_id):
+        return await self.shard(node_id).current_seq(node_id)
+
+    async def create(self, node_id, compression=None):
+        await self.shard(node_id).create(node_id, compression)
+
+    async def compression(self, node_id):
+        return await self.shard(node_id).compression(node_id)
+
+    async def list_nodes(self, cursor, count, stats):
+        """Page through the shards one after the other.
+
+        The cursor combines the shard and the cursor within it.
+        """
+        index, shard_cursor = cursor % len(self.shards), cursor // len(self.shards)
+        shard_cursor, nodes = await self.shards[index].list_nodes(
+            shard_cursor, count, stats
+        )
+        if shard_cursor == 0:
+            index += 1
+            if index == len(self.shards):
+                return 0, nodes
+        return shard_cursor * len(self.shards) + index, nodes
+
+    async def append(self, node_id, metadata, payloads):
+        return await self.shard(node_id).append(node_id, metadata, payloads)
+
+    async def fetch(self, node_id, seq_nums):
+        return await self.shard(node_id).fetch(node_id, seq_nums)
+
+    async def reset(self, node_id):
+        await self.shard(node_id).reset(node_id)
+
+
+class ShardedHub:
+    """The hub of a ShardedStorage: each node is followed on its own shard."""
+
+    def __init__(self, hubs, shard_index):
+        self.hubs = hubs
+        self._shard_index = shard_index
+        self.release_callbacks = []
+        self.frame_callbacks = []
+        for hub in hubs:
+            hub.release_callbacks = self.release_callbacks
+            hub.frame_callbacks = self.frame_callbacks
+        self.published = ChainMap(*(hub.published for hub in hubs))
+
+    @property
+    def subscriptions(self):
+        return sum(hub.subscriptions for hub in self.hubs)
+
+    def queue_depths(self):
+        return [depth for hub in self.hubs for depth in hub.queue_depths()]
+
+    def follows(self, node_id):
+        return self.hubs[self._shard_index(node_id)].follows(node_id)
+
+    async def subscribe(self, node_id, queue=None):
+        return await self.hubs[self._shard_index(node_id)].subscribe(node_id, queue)
+
+    async def unsubscribe(self, node_id, queue):
+        await self.hubs[self._shard_index(node_id)].unsubscribe(node_id, queue)
+
+    async def aclose(self):
+        await asyncio.gather(*(hub.aclose() for hub in self.hubs))
+
+
+class MultiplexedSubscription:
+    """One node subscribed to on a multiplexed socket.
+
+    The hub puts sequence numbers on this subscription's own SubscriberQueue,
+    and the subscription is put on the shared outbox of the socket while
+    anything is waiting there, so that nodes take turns. next_seq is the next
+    sequence number owed to the client, or None until the first live frame.
+    Frames up to replayed_to were stored before the client subscribed.
+    """
+
+    def __init__(self, node_id, outbox, queue, next_seq=None):
+        self.node_id = node_id
+        self.next_seq = next_seq
+        self.replayed_to = 0
+        self.queue = queue
+        self.scheduled = False
+        self._outbox = outbox
+
+    def qsize(self):
+        return self.queue.qsize()
+
+    def put_nowait(self, seq_num):
+        self.queue.put_nowait(seq_num)
+        self.schedule()
+
+    def schedule(self):
+        if not self.scheduled:
+            self.scheduled = True
+            self._outbox.put_nowait(self)
+
+
+class Histogram:
+    """A Prometheus histogram of durations in seconds.
+
+    Observing a value is a bisect and two additions, cheap enough for the hot
+    path. Buckets count the values up to their bound; they are made cumulative
+    when rendered.
+    """
+
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        total = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            total += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {total}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {total}")
+        return lines
+
+
+class Metrics:
+    """Timings and counters of one worker process, for the /metrics endpoint.
+
+    Counters are plain attributes incremented in place.
+    """
+
+    def __init__(self):
+        self.append_seconds = Histogram(
+            "streaming_append_seconds", "Round trip of the append script."
+        )
+        self.fetch_seconds = Histogram(
+            "streaming_fetch_seconds",
+            "Pipelined read of stored frames (HMGET per frame, or XRANGE).",
+        )
+        self.send_seconds = Histogram(
+            "streaming_send_seconds", "Sending one message on a WebSocket."
+        )
+        self.delivery_seconds = Histogram(
+            "streaming_delivery_seconds",
+            "From appending a frame to sending it to a live subscriber.",
+        )
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.replays = 0
+        self.websockets = 0
+
+    def render(self, counters, gauges):
+        """Render the histograms in the Prometheus text format.
+
+        counters and gauges map further metric names to (help, value).
+        """
+        lines = []
+        for histogram in (
+            self.append_seconds,
+            self.fetch_seconds,
+            self.send_seconds,
+            self.delivery_seconds,
+        ):
+            lines.extend(histogram.render())
+        for kind, metrics in (("counter", counters), ("gauge", gauges)):
+            for name, (help, value) in metrics.items():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
 
 
 def build_app(settings: Settings):
-    redis_client = redis.from_url(settings.redis_url)
+    redis_clients = [redis.from_url(url) for url in settings.redis_urls] or [
+        redis.from_url(settings.redis_url)
+    ]
+    backend = STORAGE_BACKENDS[settings.storage_backend]
+    if len(redis_clients) == 1:
+        storage = backend(redis_clients[0], settings)
+    else:
+        storage = ShardedStorage(
+            [backend(redis_client, settings) for redis_client in redis_clients]
+        )
+    hub = storage.make_hub()
+    cache = MessageCache(settings.cache_max_bytes, settings.cache_ttl)
+    hub.release_callbacks.append(cache.discard)
+    recent = RecentFrames(
+        settings.recent_frames,
+        settings.recent_frames_max_bytes,
+        settings.recent_frames_idle,
+    )
+    hub.release_callbacks.append(recent.discard)
+    hub.frame_callbacks.append(recent.put)
+    subscriber_stats = SubscriberStats()
+    metrics = Metrics()
 
     @asynccontextmanager
     async def lifespan(app: FastAPI):
+        # Startup - load the Lua scripts so that appends only send their SHA
+        await storage.load_scripts()
         yield
-        # Shutdown - close Redis connection
-        await redis_client.aclose()
+        # Shutdown - close the shared subscription, then the Redis connections
+        await hub.aclose()
+        for redis_client in redis_clients:
+            await redis_client.aclose()
 
     app = FastAPI(lifespan=lifespan)
+    app.state.hub = hub
+    app.state.cache = cache
+    app.state.recent = recent
+    app.state.storage = storage
+    app.state.subscriber_stats = subscriber_stats
+    app.state.metrics = metrics
 
     @app.middleware("http")
     async def add_server_header(request: Request, call_next):
@@ -35,55 +1694,275 @@ def build_app(settings: Settings):
         return response
 
     @app.post("/upload")
-    async def create():
-        "Declare a new dataset."
+    async def create(compression: Optional[str] = None):
+        """Declare a new dataset.
+
+        With compression (one of CODECS), the server compresses the frames
+        of this dataset before storing them.
+        """
+        if compression is not None and compression not in CODECS:
+            raise HTTPException(
+                status_code=400, detail=f"Unsupported compression {compression!r}"
+            )
 
         # Generate a rnadom node_id.
         # (In Tiled, PostgreSQL will give us a unique ID.)
         node_id = np.random.randint(1_000_000)
         # Allocate a counter for this node_id.
-        await redis_client.setnx(f"seq_num:{node_id}", 0)
+        await storage.create(str(node_id), compression)
         return {"node_id": node_id}
 
     @app.delete("/upload/{node_id}", status_code=204)
     async def close(node_id):
         "Declare that a dataset is done streaming."
 
-        await redis_client.delete(f"seq_num:{node_id}")
-        # TODO: Shorten TTL on all extant data for this node.
+        await storage.reset(node_id)
         return None
 
+    # node_id -> (expires_at, codec) for the compression of recently seen nodes
+    node_compression = {}
+
+    async def compression_for(node_id):
+        "The codec the server applies to node_id, looked up at most every cache_ttl."
+        now = time.monotonic()
+        entry = node_compression.get(node_id)
+        if entry is None or entry[0] < now:
+            if len(node_compression) >= 10_000:
+                for key, (expires_at, _) in list(node_compression.items()):
+                    if expires_at < now:
+                        del node_compression[key]
+            entry = (now + settings.cache_ttl, await storage.compression(node_id))
+            node_compression[node_id] = entry
+        return entry[1]
+
+    async def append_frames(
+        node_id, metadata, payloads, content_encoding=None, compress=True
+    ):
+        """Store frames and notify subscribers, returning the first and last seq_num.
+
+        content_encoding names the codec the payloads are already compressed
+        with. Otherwise they are compressed if the node was created with a
+        codec (and compress is true) and they are big enough to be worth it.
+        """
+        received = sum(map(len, payloads))
+        if content_encoding is not None:
+            if content_encoding not in CODECS:
+                raise HTTPException(
+                    status_code=415,
+                    detail=f"Unsupported Content-Encoding {content_encoding!r}",
+                )
+        elif compress and received >= settings.compression_min_bytes * len(payloads):
+            content_encoding = await compression_for(node_id)
+            if content_encoding is not None:
+                payloads = await apply_codec(CODECS[content_encoding][0], payloads)
+        if content_encoding is not None:
+            metadata["Content-Encoding"] = content_encoding
+        metadata = json.dumps(metadata).encode("utf-8")
+        generation = recent.generation
+        start = time.perf_counter()
+        first, last = await storage.append(node_id, metadata, payloads)
+        metrics.append_seconds.observe(time.perf_counter() - start)
+        if hub.follows(node_id):
+            recent.put(
+                node_id,
+                [
+                    (first + i, (payload, metadata))
+                    for i, payload in enumerate(payloads)
+                ],
+                generation,
+            )
+        metrics.frames_in += len(payloads)
+        metrics.bytes_in += received
+        return first, last
+
+    async def apply_codec(codec, payloads):
+        "Apply a compress or decompress function to payloads, in a thread if big."
+        if sum(map(len, payloads)) >= settings.codec_thread_bytes:
+            return await asyncio.to_thread(lambda: [codec(p) for p in payloads])
+        return [codec(payload) for payload in payloads]
+
+    async def declare_array(metadata, headers, payloads, content_encoding=None):
+        """Record the dtype and shape declared in the X-Dtype and X-Shape headers.
+
+        The shape is comma-separated; without one, arrays are 1-d. The dtype
+        defaults to float64. Payloads must match the declaration, once
+        decompressed if content_encoding names the codec they were sent with.
+        """
+        dtype, shape = headers.get("X-Dtype"), headers.get("X-Shape")
+        if dtype is None and shape is None:
+            return
+        if content_encoding is not None:
+            if content_encoding not in CODECS:
+                raise HTTPException(
+                    status_code=415,
+                    detail=f"Unsupported Content-Encoding {content_encoding!r}",
+                )
+            try:
+                payloads = await apply_codec(CODECS[content_encoding][1], payloads)
+            except Exception as e:
+                raise HTTPException(
+                    status_code=400, detail=f"Invalid {content_encoding} payload: {e}"
+                )
+        try:
+            dtype = np.dtype(dtype if dtype is not None else np.float64)
+            shape = [int(n) for n in shape.split(",")] if shape else [-1]
+            for payload in payloads:
+                np.frombuffer(payload, dtype=dtype).reshape(shape)
+        except (TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid array: {e}")
+        metadata["dtype"] = dtype.str
+        metadata["shape"] = shape
+
+    async def append_frame(node_id, metadata, payload, **kwargs):
+        "Store a frame and notify subscribers, returning its sequence number."
+        seq_num, _ = await append_frames(node_id, metadata, [payload], **kwargs)
+        return seq_num
+
+    async def ingest_frames(node_id, metadata, headers, frames, content_encoding):
+        """Store frames from the async iterator frames as they arrive.
+
+        Frames are appended in groups of about settings.ingest_chunk_bytes, so
+        that an upload holds at most one group in memory whatever its size.
+        Each group gets contiguous sequence numbers, but groups of concurrent
+        writers to the same node may interleave, so the [first, last] range
+        of each group is returned. A malformed upload is rejected with 400,
+        keeping the groups already stored.
+        """
+        ranges = []
+        group = []
+        size = 0
+
+        async def flush():
+            nonlocal size
+            await declare_array(metadata, headers, group, content_encoding)
+            ranges.append(
+                await append_frames(
+                    node_id, dict(metadata), group, content_encoding=content_encoding
+                )
+            )
+            group.clear()
+            size = 0
+
+        try:
+            async for frame in frames:
+                group.append(frame)
+                size += len(frame)
+                if size >= settings.ingest_chunk_bytes:
+                    await flush()
+        except ValueError as e:
+            stored = ", ".join(f"{first}..{last}" for first, last in ranges)
+            stored = f" after storing {stored}" if stored else ""
+            raise HTTPException(status_code=400, detail=f"Invalid upload{stored}: {e}")
+        if group:
+            await flush()
+        if not ranges:
+            raise HTTPException(status_code=400, detail="Empty upload")
+        return ranges
+
+    def frame_size(headers):
+        "The X-Frame-Size header, splitting an upload into fixed-size frames."
+        frame_size = headers.get("X-Frame-Size")
+        if frame_size is None:
+            return None
+        try:
+            frame_size = int(frame_size)
+            if frame_size < 1:
+                raise ValueError("must be positive")
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid X-Frame-Size: {e}")
+        return frame_size
+
     @app.post("/upload/{node_id}")
     async def append(node_id, request: Request):
-        "Append data to a dataset."
+        """Append data to a dataset.
 
-        # get data from request body
-        binary_data = await request.body()
+        Arrays may declare their dtype and shape (see declare_array).
+
+        With an X-Frame-Size header, the body is instead split into frames of
+        that many bytes, each stored as its own sequence number while the
+        body is still arriving (see ingest_frames). The response gives the
+        first and last sequence numbers, and the ranges assigned in between,
+        which leave out frames of other writers stored meanwhile.
+        """
         headers = request.headers
         metadata = {
             "timestamp": datetime.now().isoformat(),
         }
         metadata.setdefault("Content-Type", headers.get("Content-Type"))
+        size = frame_size(headers)
+        if size is not None:
+            ranges = await ingest_frames(
+                node_id,
+                metadata,
+                headers,
+                iter_frames(request.stream(), None, size),
+                headers.get("Content-Encoding"),
+            )
+            return {
+                "first_sequence": ranges[0][0],
+                "last_sequence": ranges[-1][1],
+                "ranges": ranges,
+            }
 
-        # Increment the counter for this node.
-        seq_num = await redis_client.incr(f"seq_num:{node_id}")
-
-        # Cache data in Redis with a TTL, and publish
-        # a notification about it.
-        pipeline = redis_client.pipeline()
-        pipeline.hset(
-            f"data:{node_id}:{seq_num}",
-            mapping={
-                "metadata": json.dumps(metadata).encode("utf-8"),
-                "payload": binary_data,  # Raw binary bytes
-            },
-        )
-        pipeline.expire(f"data:{node_id}:{seq_num}", settings.ttl)
-        pipeline.publish(f"notify:{node_id}", seq_num)
-        await pipeline.execute()
+        # A single frame is stored as one value, so it is read whole.
+        binary_data = await request.body()
+        await declare_array(
+            metadata, headers, [binary_data], headers.get("Content-Encoding")
+        )
+
+        seq_num = await append_frame(
+            node_id,
+            metadata,
+            binary_data,
+            content_encoding=headers.get("Content-Encoding"),
+        )
+        return {"sequence": seq_num}
 
-    # TODO: Implement two-way communication with subscribe, unsubscribe, flow control.
-    #   @app.websocket("/stream/many")
+    @app.post("/upload/{node_id}/batch")
+    async def append_batch(node_id, request: Request):
+        """Append many frames to a dataset in one request.
+
+        The body is either a msgpack array of payloads (Content-Type
+        application/msgpack), length-prefixed binary frames, or frames of the
+        size given by an X-Frame-Size header back to back. The frames are
+        stored together with contiguous sequence numbers, in one round trip,
+        or not at all: a malformed batch is rejected with 400, and one larger
+        than settings.max_batch_bytes with 413. Each frame's Content-Type is
+        taken from the X-Frame-Content-Type header, and X-Frame-Content-Encoding
+        names the codec of frames sent compressed. X-Dtype and X-Shape declare
+        the arrays, as for single frames.
+        """
+        headers = request.headers
+        payloads = []
+        size = 0
+        try:
+            async for frame in iter_frames(
+                request.stream(), headers.get("Content-Type"), frame_size(headers)
+            ):
+                payloads.append(frame)
+                size += len(frame)
+                if size > settings.max_batch_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Batch larger than {settings.max_batch_bytes} bytes",
+                    )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid batch: {e}")
+        if not payloads:
+            raise HTTPException(status_code=400, detail="Empty batch")
+
+        metadata = {
+            "timestamp": datetime.now().isoformat(),
+            "Content-Type": headers.get(
+                "X-Frame-Content-Type", "application/octet-stream"
+            ),
+        }
+        content_encoding = headers.get("X-Frame-Content-Encoding")
+        await declare_array(metadata, headers, payloads, content_encoding)
+        first, last = await append_frames(
+            node_id, metadata, payloads, content_encoding=content_encoding
+        )
+        return {"first_sequence": first, "last_sequence": last}
 
     @app.post("/close/{node_id}")
     async def close_connection(node_id: str, request: Request):
@@ -95,126 +1974,608 @@ def build_app(settings: Settings):
 
         metadata = {"timestamp": datetime.now().isoformat(), "reason": reason}
         metadata.setdefault("Content-Type", headers.get("Content-Type"))
-        # Increment the counter for this node.
-        seq_num = await redis_client.incr(f"seq_num:{node_id}")
-
-        # Cache data in Redis with a TTL, and publish
-        # a notification about it.
-        pipeline = redis_client.pipeline()
-        pipeline.hset(
-            f"data:{node_id}:{seq_num}",
-            mapping={
-                "metadata": json.dumps(metadata).encode("utf-8"),
-                "payload": json.dumps(None).encode("utf-8"),
-            },
-        )
-        pipeline.expire(f"data:{node_id}:{seq_num}", settings.ttl)
-        pipeline.publish(f"notify:{node_id}", seq_num)
-        await pipeline.execute()
+        # The end marker is never compressed, so that it is always recognized.
+        await append_frame(node_id, metadata, END_OF_STREAM, compress=False)
 
         return {
             "status": f"Connection for node {node_id} is now closed.",
             "reason": reason,
         }
 
+    async def fetch_messages(keys):
+        """Fetch the frames for cache keys in one round trip and encode them.
+
+        The keys all belong to one node and encoding. Recent frames held in
+        memory are not fetched again.
+        """
+        node_id, _, encoding = keys[0]
+        seq_nums = [seq_num for _, seq_num, _ in keys]
+        frames = recent.get(node_id, seq_nums)
+        missing = [seq_num for seq_num, frame in zip(seq_nums, frames) if frame is None]
+        if missing:
+            generation = recent.generation
+            start = time.perf_counter()
+            fetched = dict(zip(missing, await storage.fetch(node_id, missing)))
+            metrics.fetch_seconds.observe(time.perf_counter() - start)
+            if hub.follows(node_id):
+                recent.put(node_id, fetched.items(), generation)
+            frames = [
+                fetched[seq_num] if frame is None else frame
+                for seq_num, frame in zip(seq_nums, frames)
+            ]
+
+        def encode():
+            return [
+                encode_message(node_id, seq_num, *fields, *encoding)
+                for seq_num, fields in zip(seq_nums, frames)
+            ]
+
+        if compressed_size(frames) >= settings.codec_thread_bytes:
+            return await asyncio.to_thread(encode)
+        return encode()
+
+    async def load_messages(node_id, start, stop, encoding, latest=None):
+        """Return encoded frames start..stop (inclusive), via the cache.
+
+        Frames left out by the view of the encoding are skipped without being
+        fetched, except latest, the last frame the caller asked for, which
+        may be the end of the stream.
+        """
+        seq_nums = range(start, stop + 1)
+        view = encoding[2]
+        if view is not None and view.every > 1:
+            seq_nums = [s for s in seq_nums if view.keeps(s) or s == latest]
+        keys = [(node_id, seq_num, encoding) for seq_num in seq_nums]
+        values = await cache.get_many(keys, fetch_messages)
+        return [(seq_num, *value) for seq_num, value in zip(seq_nums, values)]
+
+    async def prefetched_windows(load, start, stop):
+        """Yield load(first, last) for consecutive windows covering start..stop.
+
+        Windows are settings.replay_batch_size frames long, and the next one
+        is loaded while the current one is being sent.
+        """
+        batch_size = settings.replay_batch_size
+        pending = None
+        try:
+            while start <= stop:
+                if pending is None:
+                    window = await load(start, min(start + batch_size - 1, stop))
+                else:
+                    window = await pending
+                start += batch_size
+                if start <= stop:
+                    pending = asyncio.create_task(
+                        load(start, min(start + batch_size - 1, stop))
+                    )
+                else:
+                    pending = None
+                yield window
+        finally:
+            if pending is not None:
+                pending.cancel()
+
+    async def replay_messages(node_id, start, stop, encoding):
+        """Yield (seq_num, message, end_of_stream) for frames start..stop.
+
+        encoding is the tuple of encode_message options after the frame.
+
+        Frames are fetched in pipelined windows (see prefetched_windows).
+        Missing frames are yielded with a message of None, and frames that
+        the view skips are not yielded at all (see load_messages).
+        """
+        load = functools.partial(load_messages, node_id, encoding=encoding, latest=stop)
+        async with aclosing(prefetched_windows(load, start, stop)) as windows:
+            async for window in windows:
+                for item in window:
+                    yield item
+
+    async def load_frames(node_id, start, stop):
+        "Fetch frames start..stop (inclusive) as (seq_num, payload, metadata)."
+        seq_nums = range(start, stop + 1)
+        begin = time.perf_counter()
+        frames = await storage.fetch(node_id, seq_nums)
+        metrics.fetch_seconds.observe(time.perf_counter() - begin)
+        return [(seq_num, *frame) for seq_num, frame in zip(seq_nums, frames)]
+
+    @app.get("/stream/{node_id}/range")
+    async def read_range(
+        node_id: str,
+        start: int = Query(1, ge=1),
+        stop: Optional[int] = Query(None, ge=1),
+        range_format: RangeFormat = Query("binary", alias="format"),
+        concat: bool = False,
+    ):
+        """Stream the stored frames start..stop of a node over HTTP.
+
+        stop defaults to, and is capped at, the last frame appended. Frames
+        are fetched in pipelined windows and each window is sent as one chunk
+        as soon as it is encoded (see encode_range), so that the range is
+        never held in memory whole. Frames that have expired are left out.
+        """
+        if concat and range_format != "binary":
+            raise HTTPException(
+                status_code=400, detail="concat is only supported with format=binary"
+            )
+        current_seq = await storage.current_seq(node_id)
+        stop = current_seq if stop is None else min(stop, current_seq)
+
+        async def chunks():
+            load = functools.partial(load_frames, node_id)
+            async with aclosing(prefetched_windows(load, start, stop)) as windows:
+                async for window in windows:
+                    encode = functools.partial(
+                        encode_range, node_id, window, range_format, concat
+                    )
+                    if (
+                        compressed_size(frame[1:] for frame in window)
+                        >= settings.codec_thread_bytes
+                    ):
+                        chunk = await asyncio.to_thread(encode)
+                    else:
+                        chunk = encode()
+                    if chunk:
+                        yield chunk
+
+        return StreamingResponse(chunks(), media_type=RANGE_MEDIA_TYPES[range_format])
+
+    def make_queue(queue_size, queue_policy):
+        return SubscriberQueue(
+            queue_size or settings.subscriber_queue_size,
+            queue_policy or settings.subscriber_queue_policy,
+            subscriber_stats,
+        )
+
+    async def send_message(websocket, node_id, seq_num, message, live=True):
+        """Send a message, timing its delivery if it is live.
+
+        Frames replayed to a client that asked for a seq_num are not live, as
+        they may have been appended long before.
+        """
+        start = time.perf_counter()
+        if isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message)
+        metrics.send_seconds.observe(time.perf_counter() - start)
+        metrics.frames_out += 1
+        metrics.bytes_out += len(message)
+        published = hub.published.get(node_id)
+        if live and published is not None and published[0] == seq_num:
+            # The newest frame announced; time it from when it was appended.
+            metrics.delivery_seconds.observe(time.time() - published[1])
+
     @app.websocket("/stream/single/{node_id}")  # one-way communcation
     async def websocket_endpoint(
         websocket: WebSocket,
         node_id: str,
         envelope_format: str = "json",
         seq_num: Optional[int] = None,
+        queue_size: Optional[int] = Query(None, ge=1),
+        queue_policy: Optional[QueuePolicy] = None,
+        compressed: bool = False,
+        every: int = 1,
+        slices: Optional[str] = Query(None, alias="slice"),
+        bins: Optional[str] = Query(None, alias="bin"),
+        reduce: str = "mean",
+        mode: Literal["all", "latest"] = "all",
+        max_hz: Optional[float] = Query(None, gt=0),
     ):
+        """Stream one node.
+
+        In the default mode every frame is sent, in order. With mode=latest
+        only the newest frame is sent whenever the client is ready, at most
+        max_hz times a second if given, and the frames skipped in between are
+        never read from Redis. seq_num then starts with the newest frame.
+
+        With compressed=true, frames stored compressed are sent as stored with
+        the msgpack and binary envelopes (see encode_message); otherwise they
+        are decompressed.
+
+        every, slice, bin and reduce ask for a reduced View of the frames,
+        such as every=10&slice=0:512,0:512&bin=4&reduce=max. Subscribers asking
+        for the same view share the work of computing it.
+
+        queue_size and queue_policy choose how this subscriber is treated if it
+        falls behind (see SubscriberQueue). Under the disconnect policy the
+        socket is closed with code 4000 and a JSON reason such as
+        {"last_sequence": 41}; reconnect with seq_num=42 to resume.
+        """
         await websocket.accept(
             headers=[(b"x-server-host", socket.gethostname().encode())]
         )
         end_stream = asyncio.Event()
 
-        async def stream_data(seq_num):
-            key = f"data:{node_id}:{seq_num}"
-            payload, metadata = await redis_client.hmget(key, "payload", "metadata")
-            if payload is None and metadata is None:
-                return
+        try:
+            view = View.parse(every, slices, bins, reduce)
+        except ValueError as e:
+            await websocket.close(code=1008, reason=str(e))
+            return
+        encoding = (envelope_format, compressed, view)
+
+        # Next sequence number owed to the client, None until the first frame.
+        next_seq = seq_num
+        latest = mode == "latest"
+        min_interval = 1 / max_hz if latest and max_hz else 0
+        last_sent = 0.0
+
+        async def catch_up(target, live=True):
+            "Send every frame up to target that has not been sent yet."
+            nonlocal next_seq
+            if next_seq is None:
+                next_seq = target
+            if target < next_seq:
+                return  # Already sent during replay
+            async with aclosing(
+                replay_messages(node_id, next_seq, target, encoding)
+            ) as frames:
+                async for s, message, end_of_stream in frames:
+                    next_seq = s + 1
+                    if message is None:
+                        continue
+                    await send_message(websocket, node_id, s, message, live)
+                    if end_of_stream:
+                        # This means that the stream is closed by the producer
+                        end_stream.set()
+                        return
+
+        async def wait_for_disconnect():
+            "Return once the client goes away; it sends nothing else."
             try:
-                payload = np.frombuffer(payload, dtype=np.float64).tolist()
-            except Exception:
-                payload = json.loads(payload)
-            data = {
-                "sequence": seq_num,
-                "metadata": metadata.decode("utf-8"),
-                "payload": payload,
-                "server_host": socket.gethostname(),
-            }
-            if envelope_format == "msgpack":
-                data = msgpack.packb(data)
-                await websocket.send_bytes(data)
-            else:
-                await websocket.send_text(json.dumps(data))
-            if payload is None and metadata is not None:
-                # This means that the stream is closed by the producer
-                end_stream.set()
+                while (await websocket.receive())["type"] != "websocket.disconnect":
+                    pass
+            except (RuntimeError, WebSocketDisconnect):
+                pass  # Closed by the server
 
-        # Setup buffer
-        stream_buffer = asyncio.Queue()
+        async def next_notification():
+            """Wait for the next notification, or return None if the client left.
 
-        async def buffer_live_events():
-            pubsub = redis_client.pubsub()
+            The wait is purely event-driven: an idle socket costs no wakeups.
+            """
             try:
-                await pubsub.subscribe(f"notify:{node_id}")
-                async for message in pubsub.listen():
-                    if message.get("type") == "message":
-                        try:
-                            live_seq = int(message["data"])
-                            await stream_buffer.put(live_seq)
-                        except Exception as e:
-                            print(f"Error parsing live message: {e}")
-                            break  # Exit loop on error
-            except asyncio.CancelledError:
-                # Task was cancelled by live_task.cancel() - don't re-raise, just clean up
+                return stream_buffer.get_nowait()
+            except asyncio.QueueEmpty:
                 pass
-            except Exception as e:
-                print(f"Live subscription error: {e}")
-            finally:
-                await pubsub.unsubscribe(f"notify:{node_id}")
-                await pubsub.aclose()
-
-        live_task = asyncio.create_task(buffer_live_events())
-
-        if seq_num is not None:
-            current_seq = await redis_client.get(f"seq_num:{node_id}")
-            current_seq = int(current_seq) if current_seq is not None else 0
-            # Replay old data
-            for s in range(seq_num, current_seq + 1):
-                await stream_data(s)
-        # New data
+            getter = asyncio.create_task(stream_buffer.get())
+            await asyncio.wait(
+                {getter, disconnected}, return_when=asyncio.FIRST_COMPLETED
+            )
+            if not getter.done():
+                getter.cancel()
+                return None
+            return getter.result()
+
+        # Subscribe before reading the current sequence number so that no
+        # frame published in between can be missed.
+        stream_buffer = await hub.subscribe(
+            node_id, make_queue(queue_size, "latest" if latest else queue_policy)
+        )
+        disconnected = asyncio.create_task(wait_for_disconnect())
+        metrics.websockets += 1
         try:
+            if seq_num is not None:
+                # Replay old data
+                metrics.replays += 1
+                target = await storage.current_seq(node_id)
+                if latest:
+                    next_seq = max(next_seq, target)
+                await catch_up(target, live=False)
+                last_sent = time.monotonic()
+            # New data
             while not end_stream.is_set():
+                if min_interval:
+                    # Let notifications coalesce until the next frame is due.
+                    await asyncio.sleep(last_sent + min_interval - time.monotonic())
                 try:
-                    async with asyncio.timeout(1.0):
-                        live_seq = await stream_buffer.get()
-                except asyncio.TimeoutError:
-                    # No data for 1 second - continue waiting
-                    # Client disconnect will be detected on next send operation
-                    continue
+                    notification = await next_notification()
+                    if notification is None:
+                        print(f"Client disconnected from node {node_id}")
+                        break
+                    live_seq, skip = notification
+                except SlowConsumer:
+                    last_sequence = next_seq - 1 if next_seq is not None else None
+                    await websocket.close(
+                        code=SLOW_CONSUMER_CLOSE_CODE,
+                        reason=json.dumps({"last_sequence": last_sequence}),
+                    )
+                    break
                 else:
-                    await stream_data(live_seq)
+                    if live_seq is None:
+                        # The node was closed; its sequence numbers start over.
+                        next_seq = 1
+                    else:
+                        if (skip or latest) and next_seq is not None:
+                            # Frames before live_seq were dropped by the policy.
+                            next_seq = max(next_seq, live_seq)
+                        await catch_up(live_seq)
+                        last_sent = time.monotonic()
             else:
                 await websocket.close(code=1000, reason="Producer ended stream")
         except WebSocketDisconnect:
             print(f"Client disconnected from node {node_id}")
+        except ViewError as e:
+            await websocket.close(code=1008, reason=str(e))
         finally:
-            # Properly cancel and wait for the live task to cleanup with timeout
-            live_task.cancel()
+            metrics.websockets -= 1
+            disconnected.cancel()
+            await hub.unsubscribe(node_id, stream_buffer)
+
+    @app.websocket("/stream/many")  # two-way communication
+    async def multiplexed_endpoint(
+        websocket: WebSocket,
+        envelope_format: str = "json",
+        credits: int = 0,
+        queue_size: Optional[int] = Query(None, ge=1),
+        queue_policy: Optional[QueuePolicy] = None,
+        compressed: bool = False,
+        every: int = 1,
+        slices: Optional[str] = Query(None, alias="slice"),
+        bins: Optional[str] = Query(None, alias="bin"),
+        reduce: str = "mean",
+    ):
+        """Stream any number of nodes over one socket.
+
+        The client controls the socket with JSON text messages:
+
+            {"action": "subscribe", "node_id": ..., "seq_num": ...}
+            {"action": "unsubscribe", "node_id": ...}
+            {"action": "credit", "credits": ...}
+
+        seq_num is optional and replays from that sequence number. The server
+        answers each subscribe and unsubscribe with a JSON text message such as
+        {"event": "subscribed", "node_id": ...}, and rejected commands with
+        {"event": "error", "detail": ...}. These replies are not subject to
+        flow control. Each frame sent consumes one credit, and nothing is sent
+        while the client has no credit left. Frames carry their node_id and
+        sequence. compressed and the view parameters are as for
+        /stream/single, and apply to every node.
+
+        queue_size and queue_policy apply to each node separately. Under the
+        disconnect policy a node that falls behind is unsubscribed with
+        {"event": "overflow", "node_id": ..., "last_sequence": ...}; subscribe
+        again with seq_num one past last_sequence to resume.
+        """
+        await websocket.accept(
+            headers=[(b"x-server-host", socket.gethostname().encode())]
+        )
+        try:
+            view = View.parse(every, slices, bins, reduce)
+        except ValueError as e:
+            await websocket.close(code=1008, reason=str(e))
+            return
+        encoding = (envelope_format, compressed, view)
+        outbox = asyncio.Queue()
+        subscriptions = {}
+        send_lock = asyncio.Lock()
+        has_credit = asyncio.Event()
+        if credits > 0:
+            has_credit.set()
+
+        async def drop(subscription):
+            if subscriptions.get(subscription.node_id) is subscription:
+                del subscriptions[subscription.node_id]
+                await hub.unsubscribe(subscription.node_id, subscription)
+
+        async def reply(event, **kwargs):
+            async with send_lock:
+                await websocket.send_text(json.dumps({"event": event, **kwargs}))
+
+        async def receive_commands():
+            nonlocal credits
+            while True:
+                text = await websocket.receive_text()
+                try:
+                    command = json.loads(text)
+                    action = command["action"]
+                    if action == "subscribe":
+                        node_id = str(command["node_id"])
+                        seq_num = command.get("seq_num")
+                        seq_num = int(seq_num) if seq_num is not None else None
+                    elif action == "unsubscribe":
+                        node_id = str(command["node_id"])
+                    elif action == "credit":
+                        granted = int(command["credits"])
+                    else:
+                        raise ValueError(f"Unknown action {action!r}")
+                except Exception as e:
+                    await reply("error", detail=f"Invalid command: {e}")
+                    continue
+
+                if action == "subscribe":
+                    if node_id in subscriptions:
+                        await reply("error", detail=f"Already subscribed to {node_id}")
+                        continue
+                    subscription = MultiplexedSubscription(
+                        node_id, outbox, make_queue(queue_size, queue_policy), seq_num
+                    )
+                    subscriptions[node_id] = subscription
+                    try:
+                        await hub.subscribe(node_id, subscription)
+                    except Exception as e:
+                        print(f"Error subscribing to node {node_id}: {e!r}")
+                        del subscriptions[node_id]
+                        await reply("error", detail=f"Could not subscribe to {node_id}")
+                        continue
+                    if seq_num is not None:
+                        metrics.replays += 1
+                        # Catch up to the current sequence number; live frames
+                        # that arrive meanwhile only extend the catch-up.
+                        subscription.replayed_to = await storage.current_seq(node_id)
+                        subscription.put_nowait(subscription.replayed_to)
+                    await reply("subscribed", node_id=node_id)
+                elif action == "unsubscribe":
+                    subscription = subscriptions.get(node_id)
+                    if subscription is not None:
+                        await drop(subscription)
+                    await reply("unsubscribed", node_id=node_id)
+                else:
+                    credits += granted
+                    if credits > 0:
+                        has_credit.set()
+
+        async def send_frames():
+            nonlocal credits
+            while True:
+                subscription = await outbox.get()
+                subscription.scheduled = False
+                if subscriptions.get(subscription.node_id) is not subscription:
+                    continue  # Unsubscribed meanwhile
+                try:
+                    item, skip = subscription.queue.get_nowait()
+                except SlowConsumer:
+                    next_seq = subscription.next_seq
+                    await drop(subscription)
+                    await reply(
+                        "overflow",
+                        node_id=subscription.node_id,
+                        last_sequence=next_seq - 1 if next_seq is not None else None,
+                    )
+                    continue
+                if subscription.qsize():
+                    # Let the other nodes take a turn before the rest.
+                    subscription.schedule()
+                if item is None:
+                    # The node was closed; its sequence numbers start over.
+                    subscription.next_seq = 1
+                    subscription.replayed_to = 0
+                    continue
+                if skip and subscription.next_seq is not None:
+                    # Frames before item were dropped by the policy.
+                    subscription.next_seq = max(subscription.next_seq, item)
+                if subscription.next_seq is None:
+                    subscription.next_seq = item
+                if item < subscription.next_seq:
+                    continue  # Already sent
+                # Send everything owed up to item, in order and exactly once.
+                async with aclosing(
+                    replay_messages(
+                        subscription.node_id,
+                        subscription.next_seq,
+                        item,
+                        encoding,
+                    )
+                ) as frames:
+                    async for seq_num, message, end_of_stream in frames:
+                        if message is None:
+                            subscription.next_seq = seq_num + 1
+                            continue
+                        while credits <= 0:
+                            has_credit.clear()
+                            await has_credit.wait()
+                        if (
+                            subscriptions.get(subscription.node_id) is not subscription
+                            or subscription.queue.overflowed
+                        ):
+                            break  # Unsubscribed or cut off while waiting
+                        subscription.next_seq = seq_num + 1
+                        async with send_lock:
+                            await send_message(
+                                websocket,
+                                subscription.node_id,
+                                seq_num,
+                                message,
+                                live=seq_num > subscription.replayed_to,
+                            )
+                        credits -= 1
+                        if end_of_stream:
+                            await drop(subscription)
+                            break
+
+        async def run_sender():
             try:
-                # Wait for task to finish cleanup (unsubscribe, close pubsub connection)
-                # before allowing WebSocket handler to exit
-                await asyncio.wait_for(live_task, timeout=2.0)
-            except (asyncio.TimeoutError, asyncio.CancelledError):
-                pass  # Task cleanup completed or timed out
+                await send_frames()
+            except WebSocketDisconnect:
+                pass  # Noticed by receive_commands
+            except ViewError as e:
+                await websocket.close(code=1008, reason=str(e))
+            except Exception as e:
+                print(f"Multiplexed stream error: {e}")
+                await websocket.close(code=1011)
+
+        # Commands are received on this task; frames are sent from another.
+        sender = asyncio.create_task(run_sender())
+        metrics.websockets += 1
+        try:
+            await receive_commands()
+        except WebSocketDisconnect:
+            print("Client disconnected from multiplexed stream")
+        finally:
+            metrics.websockets -= 1
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
+            for subscription in list(subscriptions.values()):
+                await drop(subscription)
 
     @app.get("/stream/live")
-    async def list_live_streams():
-        nodes = await redis_client.keys("seq_num:*")
-        return [node.decode("utf-8").split(":")[1] for node in nodes]
+    async def list_live_streams(
+        cursor: int = Query(0, ge=0),
+        count: int = Query(100, ge=1, le=10_000),
+        stats: bool = False,
+    ):
+        """List live nodes a page at a time.
+
+        Pass the returned cursor back to get the next page; a cursor of 0
+        means the listing is complete. With stats=true each node comes with
+        its latest sequence number and last write time.
+        """
+        cursor, nodes = await storage.list_nodes(cursor, count, stats)
+        return {"nodes": nodes, "cursor": cursor}
+
+    @app.get("/metrics")
+    async def metrics_endpoint():
+        "Metrics of this worker process in the Prometheus text format."
+        depths = hub.queue_depths()
+        counters = {
+            "streaming_frames_in_total": ("Frames appended.", metrics.frames_in),
+            "streaming_bytes_in_total": ("Payload bytes appended.", metrics.bytes_in),
+            "streaming_frames_out_total": ("Messages sent.", metrics.frames_out),
+            "streaming_bytes_out_total": ("Message bytes sent.", metrics.bytes_out),
+            "streaming_replays_total": (
+                "Subscriptions that asked to replay from a seq_num.",
+                metrics.replays,
+            ),
+            "streaming_cache_hits_total": ("Message cache hits.", cache.hits),
+            "streaming_cache_misses_total": ("Message cache misses.", cache.misses),
+            "streaming_recent_hits_total": (
+                "Frames read from the recent frames in memory.",
+                recent.hits,
+            ),
+            "streaming_recent_misses_total": (
+                "Frames fetched from Redis for want of a recent copy.",
+                recent.misses,
+            ),
+            "streaming_dropped_total": (
+                "Notifications dropped for slow subscribers.",
+                subscriber_stats.dropped,
+            ),
+            "streaming_coalesced_total": (
+                "Notifications superseded by a newer one under the latest policy.",
+                subscriber_stats.coalesced,
+            ),
+            "streaming_slow_disconnects_total": (
+                "Subscribers cut off for falling behind.",
+                subscriber_stats.disconnected,
+            ),
+        }
+        gauges = {
+            "streaming_websockets": ("Open WebSocket connections.", metrics.websockets),
+            "streaming_subscriptions": (
+                "Nodes followed through Redis by this process.",
+                hub.subscriptions,
+            ),
+            "streaming_subscribers": ("Subscriber queues.", len(depths)),
+            "streaming_queued": ("Notifications waiting in queues.", sum(depths)),
+            "streaming_queue_depth_max": (
+                "Notifications waiting in the fullest queue.",
+                max(depths, default=0),
+            ),
+            "streaming_cache_bytes": ("Size of the message cache.", cache.size),
+            "streaming_recent_bytes": ("Size of the recent frames.", recent.nbytes),
+            "streaming_recent_nodes": ("Nodes with recent frames.", len(recent)),
+        }
+        return Response(
+            metrics.render(counters, gauges), media_type="text/plain; version=0.0.4"
+        )
 
     return app
 
@@ -223,4 +2584,8 @@ settings = Settings()
 app = build_app(settings)
 
 if __name__ == "__main__":
-    uvicorn.run(app)
+    uvicorn.run(
+        app,
+        ws_ping_interval=settings.ws_ping_interval,
+        ws_ping_timeout=settings.ws_ping_timeout,
+    )
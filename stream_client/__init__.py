@@ -0,0 +1,10 @@
+"""Async clients for the streaming server.
+
+Writer appends frames in pipelined batches; Subscriber follows a node and
+resumes after disconnects.
+"""
+
+from .subscriber import Frame, Subscriber, decode_envelope
+from .writer import Writer
+
+__all__ = ["Frame", "Subscriber", "Writer", "decode_envelope"]
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import struct
+from typing import Any, NamedTuple
+from urllib.parse import urlencode
+
+import numpy as np
+import websockets
+
+# Close code of a subscriber cut off for falling behind (see server.py)
+SLOW_CONSUMER_CLOSE_CODE = 4000
+
+
+class Frame(NamedTuple):
+    node_id: str
+    sequence: int
+    metadata: dict
+    data: Any  # a NumPy array, or the JSON value of non-array frames
+
+
+def decode_envelope(message):
+    """Decode a binary envelope into a Frame.
+
+    Array payloads become read-only NumPy arrays over the message, without a
+    copy.
+    """
+    (header_length,) = struct.unpack_from("!I", message)
+    header = json.loads(message[4 : 4 + header_length])
+    payload = memoryview(message)[4 + header_length :]
+    if header.get("content_encoding") is not None:
+        raise ValueError("Compressed envelopes are not supported")
+    if header["dtype"] is not None:
+        data = np.frombuffer(payload, dtype=header["dtype"]).reshape(header["shape"])
+    else:
+        data = json.loads(bytes(payload))
+    return Frame(
+        header["node_id"], header["sequence"], json.loads(header["metadata"]), data
+    )
+
+
+class Subscriber:
+    """Follow a node, reconnecting and resuming wherever the connection drops.
+
+    Iterating yields a Frame for each frame of the node, in order, starting
+    with seq_num if given or else with the next frame appended. After a
+    disconnect, including being cut off as a slow consumer, it reconnects
+    with growing delays up to max_delay and asks for the frames after the
+    last one seen, so none is lost or repeated. Iteration ends at the end of
+    the stream.
+
+    params are passed on to /stream/single, such as a view or queue policy.
+
+        async for frame in Subscriber("ws://localhost:8000", node_id, seq_num=1):
+            print(frame.sequence, frame.data.mean())
+    """
+
+    def __init__(self, base_url, node_id, seq_num=None, *, params=None, max_delay=10.0):
+        self.base_url = base_url.rstrip("/")
+        self.node_id = node_id
+        self.next_seq = seq_num
+        self.params = params or {}
+        self.max_delay = max_delay
+        self.reconnects = 0
+
+    def url(self):
+        params = {**self.params, "envelope_format": "binary"}
+        if self.next_seq is not None:
+            params["seq_num"] = self.next_seq
+        return f"{self.base_url}/stream/single/{self.node_id}?{urlencode(params)}"
+
+    async def __aiter__(self):
+        delay = 0.1
+        while True:
+            try:
+                async with websockets.connect(self.url(), max_size=None) as websocket:
+                    delay = 0.1
+                    while True:
+                        frame = decode_envelope(await websocket.recv())
+                        self.next_seq = frame.sequence + 1
+                        if frame.data is None:
+                            return  # End of the stream
+                        yield frame
+            except websockets.exceptions.ConnectionClosed as e:
+                code = e.rcvd.code if e.rcvd is not None else None
+                if code == 1008:
+                    raise ValueError(e.rcvd.reason) from e  # Invalid params
+                if code == 1000:
+                    return  # Closed by the server as the stream ended
+            except OSError:
+                pass  # The server is unreachable; keep trying.
+            self.reconnects += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.max_delay)
@@ -0,0 +1,195 @@
+import asyncio
+import struct
+from collections import deque
+
+import httpx
+import numpy as np
+
+try:
+    import h2
+except ImportError:
+    h2 = None
+
+
+class Writer:
+    """Append frames to nodes as fast as the server will take them.
+
+    Frames written to the same node with the same declaration (content type,
+    content encoding, dtype and shape) are coalesced into batch uploads of up
+    to batch_size frames and max_batch_bytes bytes (the server's limit). Each
+    such stream has at most one request in flight, which keeps its frames in
+    order; frames written meanwhile make up the next batch. Requests for
+    different streams run concurrently, at most max_in_flight at a time, over
+    a pool of persistent connections. HTTP/2 is used when the h2 package is
+    installed (see httpx), unless http2 is false.
+
+    write() waits while max_pending frames are unsent, so that a producer
+    faster than the server is slowed down instead of buffering without end.
+    It returns a future for the frame's sequence number. A failed upload
+    fails the futures of its frames, and the first such error is raised by
+    the next flush().
+
+        async with Writer("http://localhost:8000") as writer:
+            node_id = await writer.create()
+            for image in images:
+                await writer.write(node_id, image)
+            await writer.close(node_id)
+    """
+
+    def __init__(
+        self,
+        base_url,
+        *,
+        batch_size=100,
+        max_batch_bytes=64 * 1024 * 1024,
+        linger=0.002,
+        max_in_flight=8,
+        max_pending=10_000,
+        http2=None,
+        client=None,
+    ):
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.linger = linger
+        if client is None:
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                http2=h2 is not None if http2 is None else http2,
+                limits=httpx.Limits(
+                    max_connections=max_in_flight,
+                    max_keepalive_connections=max_in_flight,
+                ),
+                timeout=30.0,
+            )
+            self._owns_client = True
+        else:
+            self._owns_client = False
+        self._client = client
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+        self._pending = asyncio.Semaphore(max_pending)
+        # (node_id, headers) -> deque of (payload, future) not yet sent
+        self._queued = {}
+        # (node_id, headers) -> task sending them
+        self._senders = {}
+        self._error = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def create(self, compression=None):
+        "Declare a new node and return its node_id."
+        params = {"compression": compression} if compression is not None else {}
+        response = await self._client.post("/upload", params=params)
+        response.raise_for_status()
+        return response.json()["node_id"]
+
+    async def write(
+        self,
+        node_id,
+        data,
+        *,
+        content_type="application/octet-stream",
+        content_encoding=None,
+        dtype=None,
+        shape=None,
+    ):
+        """Queue a frame, returning a future for its sequence number.
+
+        NumPy arrays declare their own dtype and shape.
+        """
+        if isinstance(data, np.ndarray):
+            dtype = data.dtype.str if dtype is None else dtype
+            shape = data.shape if shape is None else shape
+            data = data.tobytes()
+        headers = {"X-Frame-Content-Type": content_type}
+        if content_encoding is not None:
+            headers["X-Frame-Content-Encoding"] = content_encoding
+        if dtype is not None:
+            headers["X-Dtype"] = str(dtype)
+        if shape is not None:
+            headers["X-Shape"] = ",".join(map(str, shape))
+
+        await self._pending.acquire()
+        key = (str(node_id), tuple(sorted(headers.items())))
+        future = asyncio.get_running_loop().create_future()
+        self._queued.setdefault(key, deque()).append((data, future))
+        if key not in self._senders:
+            self._senders[key] = asyncio.create_task(self._send(key))
+        return future
+
+    async def flush(self):
+        "Wait until every frame written so far is sent."
+        while self._senders:
+            await asyncio.gather(*self._senders.values())
+        error, self._error = self._error, None
+        if error is not None:
+            raise error
+
+    async def close(self, node_id, reason=None):
+        "Send the node's remaining frames, then mark the end of its stream."
+        await self.flush()
+        response = await self._client.post(f"/close/{node_id}", json={"reason": reason})
+        response.raise_for_status()
+
+    async def delete(self, node_id):
+        "Send the node's remaining frames, then reset it."
+        await self.flush()
+        response = await self._client.delete(f"/upload/{node_id}")
+        response.raise_for_status()
+
+    async def aclose(self):
+        try:
+            await self.flush()
+        finally:
+            if self._owns_client:
+                await self._client.aclose()
+
+    async def _send(self, key):
+        node_id, headers = key
+        frames = self._queued[key]
+        try:
+            while frames:
+                if len(frames) < self.batch_size and self.linger:
+                    # Give the producer a moment to fill the batch.
+                    await asyncio.sleep(self.linger)
+                batch = [frames.popleft()]
+                size = len(batch[0][0])
+                while (
+                    frames
+                    and len(batch) < self.batch_size
+                    and size + len(frames[0][0]) <= self.max_batch_bytes
+                ):
+                    size += len(frames[0][0])
+                    batch.append(frames.popleft())
+                body = b"".join(
+                    struct.pack("!I", len(payload)) + payload for payload, _ in batch
+                )
+                try:
+                    async with self._in_flight:
+                        response = await self._client.post(
+                            f"/upload/{node_id}/batch",
+                            content=body,
+                            headers=dict(headers),
+                        )
+                    response.raise_for_status()
+                    first = response.json()["first_sequence"]
+                except Exception as e:
+                    if self._error is None:
+                        self._error = e
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                            future.exception()  # Raised by flush() instead.
+                else:
+                    for i, (_, future) in enumerate(batch):
+                        if not future.done():
+                            future.set_result(first + i)
+                finally:
+                    for _ in batch:
+                        self._pending.release()
+        finally:
+            del self._senders[key]
+            del self._queued[key]
@@ -1,14 +1,94 @@
+import json
+import socket
+import struct
+import time
+
+import numpy as np
 import pytest
 from starlette.testclient import TestClient
 from server import build_app, Settings
 
 
-@pytest.fixture(scope="function")
-def client():
+@pytest.fixture(scope="function", params=["hash", "stream"])
+def client(request):
     """Fixture providing TestClient following ws-tests pattern."""
-    settings = Settings(redis_url="redis://localhost:6379/0", ttl=60 * 60)
+    settings = Settings(
+        redis_url="redis://localhost:6379/0",
+        ttl=60 * 60,
+        storage_backend=request.param,
+    )
     app = build_app(settings)
     
     with TestClient(app) as client:
         yield client
 
+
+def wait_for(predicate, timeout=2.0):
+    "Poll predicate until it holds, returning False after timeout seconds."
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def post_frame(client, node_id, values):
+    "Append a frame of float64 values."
+    client.post(
+        f"/upload/{node_id}",
+        content=np.array(values, dtype=np.float64).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+
+def unpack(message):
+    "Split a binary envelope into its header and payload."
+    (header_length,) = struct.unpack_from("!I", message)
+    header = json.loads(message[4 : 4 + header_length])
+    return header, message[4 + header_length :]
+
+
+def unpack_frames(body):
+    "Split frames each prefixed with a 4-byte big-endian length."
+    frames = []
+    offset = 0
+    while offset < len(body):
+        (length,) = struct.unpack_from("!I", body, offset)
+        frames.append(body[offset + 4 : offset + 4 + length])
+        offset += 4 + length
+    return frames
+
+
+def list_all(client, **params):
+    "Page through /stream/live until the cursor comes back as 0."
+    nodes = []
+    cursor = 0
+    while True:
+        page = client.get(
+            "/stream/live", params={"cursor": cursor, "count": 1, **params}
+        ).json()
+        nodes.extend(page["nodes"])
+        cursor = page["cursor"]
+        if cursor == 0:
+            return nodes
+
+
+def post_image(client, node_id, image):
+    "Append an array, declaring its dtype and shape."
+    return client.post(
+        f"/upload/{node_id}",
+        content=image.tobytes(),
+        headers={
+            "Content-Type": "application/octet-stream",
+            "X-Dtype": image.dtype.str,
+            "X-Shape": ",".join(map(str, image.shape)),
+        },
+    )
+
+
+def free_port():
+    "A local TCP port to run a test server on."
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import struct
+
+import msgpack
+import numpy as np
+import pytest
+import redis
+
+from server import StreamHub, StreamStorage, node_key
+
+
+def test_append_is_atomic_and_returns_sequence(client):
+    """Each append stores the frame with a TTL and reports its sequence number."""
+    node_id = client.post("/upload").json()["node_id"]
+    for i in range(1, 4):
+        response = client.post(
+            f"/upload/{node_id}",
+            content=np.array([float(i)]).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.json() == {"sequence": i}
+
+    storage = client.app.state.storage
+    [(payload, metadata)] = client.portal.call(storage.fetch, str(node_id), [3])
+    assert np.frombuffer(payload).tolist() == [3.0]
+    assert json.loads(metadata)["Content-Type"] == "application/octet-stream"
+
+    if isinstance(storage, StreamStorage):
+        key = node_key("stream", node_id)
+    else:
+        key = node_key("data", node_id, 3)
+    redis_client = redis.from_url("redis://localhost:6379/0")
+    try:
+        assert 0 < redis_client.ttl(key) <= 60 * 60
+    finally:
+        redis_client.close()
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_batch_append(client):
+    """A batch gets a contiguous range and live subscribers see every frame."""
+    node_id = client.post("/upload").json()["node_id"]
+    frames = [np.array([float(i)]).tobytes() for i in range(5)]
+
+    with client.websocket_connect(f"/stream/single/{node_id}") as websocket:
+        response = client.post(
+            f"/upload/{node_id}/batch",
+            content=msgpack.packb(frames[:3]),
+            headers={"Content-Type": "application/msgpack"},
+        )
+        assert response.json() == {"first_sequence": 1, "last_sequence": 3}
+
+        body = b"".join(struct.pack("!I", len(frame)) + frame for frame in frames[3:])
+        response = client.post(
+            f"/upload/{node_id}/batch",
+            content=body,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert response.json() == {"first_sequence": 4, "last_sequence": 5}
+
+        for i in range(5):
+            msg = json.loads(websocket.receive_text())
+            assert (msg["sequence"], msg["payload"]) == (i + 1, [float(i)])
+
+    response = client.post(
+        f"/upload/{node_id}/batch",
+        content=b"\x00\x00\x00\x09abc",
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    assert response.status_code == 400
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_stream_reader_survives_churn(client, monkeypatch):
+    """Following and dropping nodes in quick succession neither makes the
+    stream reader call XREAD with no streams, stalls it, nor drops its
+    connection."""
+    hub = client.app.state.hub
+    if not isinstance(hub, StreamHub):
+        pytest.skip("Only the stream backend reads with XREAD")
+    storage = client.app.state.storage
+    node_id = str(client.post("/upload").json()["node_id"])
+    redis_client = hub._redis_client
+    xread = redis_client.xread
+    reads = []
+    disconnects = []
+    disconnect = redis.asyncio.connection.AbstractConnection.disconnect
+
+    async def count(connection, *args, **kwargs):
+        disconnects.append(connection)
+        return await disconnect(connection, *args, **kwargs)
+
+    monkeypatch.setattr(
+        redis.asyncio.connection.AbstractConnection, "disconnect", count
+    )
+
+    async def record(streams, **kwargs):
+        reads.append(dict(streams))
+        return await xread(streams, **kwargs)
+
+    async def churn():
+        for _ in range(20):
+            queue = await hub.subscribe(node_id)
+            await asyncio.sleep(0)
+            await hub.unsubscribe(node_id, queue)
+        await asyncio.sleep(0.05)
+        # An error would have put the reader to sleep for a second.
+        queue = await hub.subscribe(node_id)
+        try:
+            await storage.append(node_id, b"{}", [b"frame"])
+            async with asyncio.timeout(0.5):
+                return await queue.get()
+        finally:
+            await hub.unsubscribe(node_id, queue)
+            await storage.reset(node_id)
+
+    redis_client.xread = record
+    try:
+        assert client.portal.call(churn) == 1
+    finally:
+        del redis_client.xread
+    assert all(reads)
+    assert not disconnects
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+
+from .conftest import unpack
+
+
+def test_binary_envelope_carries_raw_payload(client):
+    """The binary envelope sends the stored bytes untouched after a header."""
+    node_id = client.post("/upload").json()["node_id"]
+    data = np.arange(6, dtype=np.float64)
+    client.post(
+        f"/upload/{node_id}",
+        content=data.tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    client.post(f"/close/{node_id}", json={"reason": "done"})
+
+    with client.websocket_connect(
+        f"/stream/single/{node_id}?envelope_format=binary&seq_num=1"
+    ) as websocket:
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["sequence"] == 1
+        assert header["node_id"] == str(node_id)
+        assert header["shape"] == [6]
+        assert payload == data.tobytes()
+        np.testing.assert_array_equal(
+            np.frombuffer(payload, dtype=header["dtype"]), data
+        )
+
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["sequence"] == 2
+        assert header["dtype"] is None
+        assert json.loads(payload) is None
+
+    client.delete(f"/upload/{node_id}")
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import numpy as np
+
+from server import MessageCache
+
+
+def test_cache_shares_loads_and_evicts():
+    """Concurrent lookups share one load, and the byte budget evicts LRU first."""
+    loads = []
+
+    async def load(keys):
+        loads.append(list(keys))
+        await asyncio.sleep(0.01)
+        return [(f"message {key[1]}", False) for key in keys]
+
+    async def scenario():
+        cache = MessageCache(max_bytes=20, ttl=60)
+        keys = [("1", 1, "json"), ("1", 2, "json")]
+        first, second = await asyncio.gather(
+            cache.get_many(keys, load), cache.get_many(keys, load)
+        )
+        assert first == second == [("message 1", False), ("message 2", False)]
+        assert loads == [keys]
+        assert (cache.hits, cache.misses) == (2, 2)
+
+        # A third 9-byte message does not fit next to the first two.
+        await cache.get_many([("1", 3, "json")], load)
+        assert len(cache) == 2
+        await cache.get_many([("1", 1, "json")], load)
+        assert cache.misses == 4
+
+        cache.discard("1")
+        assert len(cache) == 0 and cache.size == 0
+
+    asyncio.run(scenario())
+
+
+def test_subscribers_share_encoded_frames(client):
+    """A second subscriber is served from the cache, and a closed node's
+    frames are dropped so reused sequence numbers are not served stale."""
+    cache = client.app.state.cache
+    node_id = client.post("/upload").json()["node_id"]
+    client.post(
+        f"/upload/{node_id}",
+        content=np.array([1.0]).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    with client.websocket_connect(f"/stream/single/{node_id}?seq_num=1") as ws:
+        assert json.loads(ws.receive_text())["payload"] == [1.0]
+        hits = cache.hits
+        with client.websocket_connect(f"/stream/single/{node_id}?seq_num=1") as ws2:
+            assert json.loads(ws2.receive_text())["payload"] == [1.0]
+        assert cache.hits == hits + 1
+
+        # Close the node and start writing to it again from sequence 1.
+        client.delete(f"/upload/{node_id}")
+        client.post(
+            f"/upload/{node_id}",
+            content=np.array([2.0]).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        msg = json.loads(ws.receive_text())
+        assert (msg["sequence"], msg["payload"]) == (1, [2.0])
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_cancelled_load_is_retried_by_waiters():
+    """Cancelling the request loading an entry does not cancel the others
+    waiting for it; they load it themselves."""
+    loads = []
+
+    async def load(keys):
+        loads.append(list(keys))
+        await asyncio.sleep(0.05)
+        return [(f"message {key[1]}", False) for key in keys]
+
+    async def scenario():
+        cache = MessageCache(max_bytes=1000, ttl=60)
+        keys = [("1", 1, "json"), ("1", 2, "json")]
+        loader = asyncio.create_task(cache.get_many(keys, load))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.get_many(keys, load)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        loader.cancel()
+        results = await asyncio.gather(*waiters)
+        assert loader.cancelled()
+        assert results == [[("message 1", False), ("message 2", False)]] * 2
+        assert loads == [keys, keys]  # The waiters shared one new load.
+
+    asyncio.run(scenario())
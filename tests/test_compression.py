@@ -0,0 +1,143 @@
+import asyncio
+import gzip
+import json
+
+import msgpack
+import numpy as np
+import pytest
+from starlette.testclient import TestClient
+
+from server import Settings, build_app
+
+from .conftest import unpack
+
+
+def test_server_compresses_per_node(client):
+    """Frames of a node created with a codec are stored compressed."""
+    node_id = client.post("/upload?compression=gzip").json()["node_id"]
+    data = np.zeros(1024, dtype=np.float64)
+    client.post(
+        f"/upload/{node_id}",
+        content=data.tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+    # Too small to be worth compressing
+    client.post(
+        f"/upload/{node_id}",
+        content=np.ones(2).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    storage = client.app.state.storage
+    [(payload, metadata), (small, small_metadata)] = client.portal.call(
+        storage.fetch, str(node_id), [1, 2]
+    )
+    assert json.loads(metadata)["Content-Encoding"] == "gzip"
+    assert len(payload) < data.nbytes
+    assert "Content-Encoding" not in json.loads(small_metadata)
+
+    # Decompressed for subscribers unless they ask otherwise
+    with client.websocket_connect(f"/stream/single/{node_id}?seq_num=1") as websocket:
+        assert json.loads(websocket.receive_text())["payload"] == data.tolist()
+        assert json.loads(websocket.receive_text())["payload"] == [1.0, 1.0]
+
+    url = f"/stream/single/{node_id}?seq_num=1&envelope_format=msgpack&compressed=true"
+    with client.websocket_connect(url) as websocket:
+        message = msgpack.unpackb(websocket.receive_bytes())
+        assert message["content_encoding"] == "gzip"
+        assert message["payload"] == payload
+        assert gzip.decompress(message["payload"]) == data.tobytes()
+
+    client.delete(f"/upload/{node_id}")
+
+
+@pytest.mark.parametrize(
+    "codec, module", [("gzip", None), ("lz4", "lz4.frame"), ("zstd", "zstandard")]
+)
+def test_codecs_round_trip(client, codec, module):
+    """Each codec compresses stored frames and decompresses them for subscribers."""
+    if module is not None:
+        pytest.importorskip(module)
+    node_id = client.post(f"/upload?compression={codec}").json()["node_id"]
+    data = np.zeros(1024, dtype=np.float64)
+    client.post(f"/upload/{node_id}", content=data.tobytes())
+
+    storage = client.app.state.storage
+    [(payload, metadata)] = client.portal.call(storage.fetch, str(node_id), [1])
+    assert json.loads(metadata)["Content-Encoding"] == codec
+    assert len(payload) < data.nbytes
+
+    url = f"/stream/single/{node_id}?seq_num=1&envelope_format=binary"
+    with client.websocket_connect(url) as websocket:
+        header, decompressed = unpack(websocket.receive_bytes())
+        assert "content_encoding" not in header
+        assert decompressed == data.tobytes()
+    with client.websocket_connect(url + "&compressed=true") as websocket:
+        header, compressed = unpack(websocket.receive_bytes())
+        assert header["content_encoding"] == codec
+        assert compressed == payload
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_producer_sends_compressed(client):
+    """Payloads sent with a Content-Encoding are stored and passed through as is."""
+    node_id = client.post("/upload").json()["node_id"]
+    data = np.arange(8, dtype=np.float64)
+    compressed = gzip.compress(data.tobytes())
+    response = client.post(
+        f"/upload/{node_id}",
+        content=compressed,
+        headers={
+            "Content-Type": "application/octet-stream",
+            "Content-Encoding": "gzip",
+        },
+    )
+    assert response.status_code == 200
+
+    url = f"/stream/single/{node_id}?seq_num=1&envelope_format=binary"
+    with client.websocket_connect(url) as websocket:
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["shape"] == [8]
+        assert payload == data.tobytes()
+    with client.websocket_connect(url + "&compressed=true") as websocket:
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["content_encoding"] == "gzip"
+        assert payload == compressed
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_unsupported_codecs_are_rejected(client):
+    assert client.post("/upload?compression=rar").status_code == 400
+    node_id = client.post("/upload").json()["node_id"]
+    response = client.post(
+        f"/upload/{node_id}", content=b"abc", headers={"Content-Encoding": "rar"}
+    )
+    assert response.status_code == 415
+    client.delete(f"/upload/{node_id}")
+
+
+def test_large_payloads_are_compressed_off_the_event_loop(monkeypatch):
+    """Codecs run in worker threads for payloads of codec_thread_bytes or more."""
+    threaded = []
+    to_thread = asyncio.to_thread
+
+    async def count(function, *args):
+        threaded.append(function)
+        return await to_thread(function, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", count)
+    settings = Settings(redis_url="redis://localhost:6379/0", codec_thread_bytes=4096)
+    with TestClient(build_app(settings)) as client:
+        node_id = client.post("/upload?compression=gzip").json()["node_id"]
+        data = np.random.random(1024)
+        client.post(f"/upload/{node_id}", content=data.tobytes())
+        assert len(threaded) == 1  # compressed
+        # Compressed random floats are still big enough to decompress in a thread.
+        response = client.get(f"/stream/{node_id}/range", params={"format": "ndjson"})
+        assert json.loads(response.text)["payload"] == data.tolist()
+        assert len(threaded) == 2
+        client.post(f"/upload/{node_id}", content=np.ones(200).tobytes())
+        assert len(threaded) == 2  # too small
+        client.delete(f"/upload/{node_id}")
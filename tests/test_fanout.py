@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from .conftest import wait_for
+
+
+def test_subscribers_share_one_subscription(client):
+    """Several sockets on one node share a single Redis subscription."""
+    hub = client.app.state.hub
+    response = client.post("/upload")
+    node_id = response.json()["node_id"]
+
+    with client.websocket_connect(f"/stream/single/{node_id}") as ws1:
+        with client.websocket_connect(f"/stream/single/{node_id}") as ws2:
+            assert wait_for(lambda: len(hub._subscribers.get(str(node_id), ())) == 2)
+            assert hub.subscriptions == 1
+
+            data = np.array([1.0, 2.0, 3.0])
+            client.post(
+                f"/upload/{node_id}",
+                content=data.tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            for websocket in (ws1, ws2):
+                msg = json.loads(websocket.receive_text())
+                assert msg["sequence"] == 1
+                assert msg["payload"] == data.tolist()
+
+    # The last subscriber leaving drops the Redis subscription.
+    assert wait_for(lambda: hub.subscriptions == 0)
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_failed_subscription_is_not_kept(client):
+    """A subscription Redis refuses or never confirms leaves no trace, so the
+    next subscriber to the node tries again."""
+    hub = client.app.state.hub
+    if not hasattr(hub, "_pubsub"):
+        pytest.skip("The stream backend has no channels to subscribe")
+
+    class FailingPubSub:
+        def __init__(self, error):
+            self.error = error
+
+        async def subscribe(self, channel):
+            if self.error is not None:
+                raise self.error
+
+        async def unsubscribe(self, channel):
+            pass
+
+    async def subscribe(node_id):
+        await hub.subscribe(node_id, asyncio.Queue())
+
+    pubsub, hub._pubsub = hub._pubsub, FailingPubSub(ConnectionError("refused"))
+    hub.subscribe_timeout = 0.1
+    try:
+        with pytest.raises(ConnectionError):
+            client.portal.call(subscribe, "failing")
+        assert not hub.follows("failing") and not hub._pending
+        hub._pubsub.error = None  # Accepted, but never confirmed
+        with pytest.raises(TimeoutError):
+            client.portal.call(subscribe, "failing")
+        assert not hub.follows("failing") and not hub._pending
+    finally:
+        hub._pubsub = pubsub
+        hub.subscribe_timeout = type(hub).subscribe_timeout
+
+    node_id = client.post("/upload").json()["node_id"]
+    with client.websocket_connect(f"/stream/single/{node_id}") as websocket:
+        assert wait_for(lambda: hub.follows(str(node_id)))
+        client.post(f"/upload/{node_id}", content=np.ones(1).tobytes())
+        assert json.loads(websocket.receive_text())["sequence"] == 1
+    client.delete(f"/upload/{node_id}")
@@ -0,0 +1,25 @@
+import json
+
+from .conftest import post_frame
+
+
+def test_latest_mode_skips_to_newest(client):
+    """Only the newest frame is sent, and skipped frames are never fetched."""
+    cache = client.app.state.cache
+    node_id = client.post("/upload").json()["node_id"]
+    for i in range(1, 6):
+        post_frame(client, node_id, [float(i)])
+
+    url = f"/stream/single/{node_id}?seq_num=1&mode=latest&max_hz=1"
+    with client.websocket_connect(url) as websocket:
+        msg = json.loads(websocket.receive_text())
+        assert (msg["sequence"], msg["payload"]) == (5, [5.0])
+
+        # Sent within a second of the last frame, so these coalesce.
+        for i in range(6, 9):
+            post_frame(client, node_id, [float(i)])
+        msg = json.loads(websocket.receive_text())
+        assert (msg["sequence"], msg["payload"]) == (8, [8.0])
+
+    assert cache.misses == 2
+    client.delete(f"/upload/{node_id}")
@@ -0,0 +1,29 @@
+import numpy as np
+
+from .conftest import list_all
+
+
+def test_live_index_pagination_and_stats(client):
+    """Created nodes are listed with their stats until they are deleted."""
+    node_a = str(client.post("/upload").json()["node_id"])
+    node_b = str(client.post("/upload").json()["node_id"])
+    client.post(
+        f"/upload/{node_a}",
+        content=np.array([1.0]).tobytes(),
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    assert {node_a, node_b} <= set(list_all(client))
+    stats = {node["node_id"]: node for node in list_all(client, stats=True)}
+    assert stats[node_a]["latest_seq"] == 1
+    assert stats[node_b]["latest_seq"] == 0
+    assert stats[node_a]["last_write"] >= stats[node_b]["last_write"]
+
+    client.delete(f"/upload/{node_a}")
+    client.delete(f"/upload/{node_b}")
+    assert not {node_a, node_b} & set(list_all(client))
+
+
+def test_invalid_paging_is_rejected(client):
+    for params in ({"count": 0}, {"count": -1}, {"cursor": -1}):
+        assert client.get("/stream/live", params=params).status_code == 422
@@ -0,0 +1,80 @@
+import json
+
+import numpy as np
+
+from server import Histogram
+
+from .conftest import wait_for
+
+
+def sample(text, name):
+    "Value of an unlabelled sample in Prometheus text format."
+    for line in text.splitlines():
+        if line.startswith(f"{name} "):
+            return float(line.split()[1])
+    raise KeyError(name)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Test.")
+    for value in (0.0002, 0.003, 0.003, 10):
+        histogram.observe(value)
+    lines = histogram.render()
+    assert 'latency_seconds_bucket{le="0.0005"} 1' in lines
+    assert 'latency_seconds_bucket{le="0.005"} 3' in lines
+    assert 'latency_seconds_bucket{le="2.5"} 3' in lines
+    assert 'latency_seconds_bucket{le="+Inf"} 4' in lines
+    assert "latency_seconds_count 4" in lines
+
+
+def test_metrics_follow_traffic(client):
+    """Appends, sends and live delivery show up on /metrics."""
+    node_id = client.post("/upload").json()["node_id"]
+    payload = np.array([1.0, 2.0], dtype=np.float64).tobytes()
+
+    with client.websocket_connect(f"/stream/single/{node_id}") as websocket:
+        # The socket is counted once it is subscribed.
+        assert wait_for(
+            lambda: sample(client.get("/metrics").text, "streaming_websockets") == 1
+        )
+        text = client.get("/metrics").text
+        assert sample(text, "streaming_subscriptions") == 1
+
+        client.post(
+            f"/upload/{node_id}",
+            content=payload,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        assert json.loads(websocket.receive_text())["sequence"] == 1
+
+        # Replaying the newest frame to late joiners is not live delivery.
+        url = f"/stream/single/{node_id}?seq_num=1"
+        with client.websocket_connect(url) as late:
+            assert json.loads(late.receive_text())["sequence"] == 1
+        with client.websocket_connect("/stream/many?credits=1") as late:
+            late.send_text(
+                json.dumps({"action": "subscribe", "node_id": node_id, "seq_num": 1})
+            )
+            replies = [json.loads(late.receive_text()) for _ in range(2)]
+            assert [reply.get("sequence") for reply in replies] in (
+                [None, 1],
+                [1, None],
+            )
+
+    response = client.get("/metrics")
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert sample(text, "streaming_frames_in_total") == 1
+    assert sample(text, "streaming_bytes_in_total") == len(payload)
+    assert sample(text, "streaming_frames_out_total") == 3
+    assert sample(text, "streaming_append_seconds_count") == 1
+    assert sample(text, "streaming_send_seconds_count") == 3
+    assert sample(text, "streaming_delivery_seconds_count") == 1
+    # The frame appended here was sent from memory, without a fetch.
+    assert sample(text, "streaming_recent_hits_total") >= 1
+    assert sample(text, "streaming_fetch_seconds_count") == 0
+    assert wait_for(
+        lambda: sample(client.get("/metrics").text, "streaming_websockets") == 0
+    )
+
+    client.delete(f"/upload/{node_id}")
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import struct
+
+import msgpack
+import numpy as np
+
+from .conftest import post_image, unpack, unpack_frames
+
+
+def test_range_formats(client):
+    """Stored frames are read back over HTTP in each format."""
+    node_id = client.post("/upload").json()["node_id"]
+    for i in range(1, 6):
+        client.post(
+            f"/upload/{node_id}",
+            content=np.array([float(i)]).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+    response = client.get(f"/stream/{node_id}/range", params={"start": 2, "stop": 4})
+    assert response.headers["content-type"] == "application/octet-stream"
+    messages = [unpack(frame) for frame in unpack_frames(response.content)]
+    assert [header["sequence"] for header, _ in messages] == [2, 3, 4]
+    assert [np.frombuffer(payload)[0] for _, payload in messages] == [2.0, 3.0, 4.0]
+
+    response = client.get(f"/stream/{node_id}/range", params={"format": "ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [msg["payload"] for msg in lines] == [[float(i)] for i in range(1, 6)]
+
+    response = client.get(
+        f"/stream/{node_id}/range", params={"format": "msgpack", "start": 5}
+    )
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(response.content)
+    assert [msg["payload"] for msg in unpacker] == [[5.0]]
+
+    # stop is capped at the last frame, so nothing past it is fetched.
+    metrics = client.app.state.metrics
+    fetches = sum(metrics.fetch_seconds.counts)
+    response = client.get(
+        f"/stream/{node_id}/range",
+        params={"format": "ndjson", "start": 4, "stop": 10**12},
+    )
+    assert [json.loads(line)["sequence"] for line in response.text.splitlines()] == [
+        4,
+        5,
+    ]
+    assert sum(metrics.fetch_seconds.counts) == fetches + 1
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_range_concatenates_arrays(client):
+    node_id = client.post("/upload").json()["node_id"]
+    images = [np.full((2, 3), i, dtype=np.uint8) for i in range(3)]
+    for image in images:
+        post_image(client, node_id, image)
+    post_image(client, node_id, np.zeros(4, dtype=np.uint8))
+    client.post(f"/close/{node_id}", json={"reason": "done"})
+
+    response = client.get(f"/stream/{node_id}/range", params={"concat": True})
+    messages = [unpack(frame) for frame in unpack_frames(response.content)]
+    (block, data), (single, _), (end, _) = messages
+    assert block["sequences"] == [1, 2, 3] and block["shape"] == [3, 2, 3]
+    assert np.array_equal(
+        np.frombuffer(data, block["dtype"]).reshape(block["shape"]), images
+    )
+    assert single["sequences"] == [4] and single["shape"] == [1, 4]
+    assert end["sequence"] == 5 and end["dtype"] is None
+
+    response = client.get(
+        f"/stream/{node_id}/range", params={"concat": True, "format": "ndjson"}
+    )
+    assert response.status_code == 400
+    client.delete(f"/upload/{node_id}")
+
+
+async def get_chunks(app, path):
+    "The body chunks the app sends for a GET of path."
+    requested = False
+    chunks = []
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()  # The client never disconnects.
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message["body"]:
+            chunks.append(message["body"])
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [],
+        "server": ("testserver", 80),
+        "client": ("testclient", 50000),
+    }
+    await app(scope, receive, send)
+    return chunks
+
+
+def test_range_streams_in_chunks(client):
+    """Each pipelined window is sent as its own chunk."""
+    node_id = client.post("/upload").json()["node_id"]
+    client.post(
+        f"/upload/{node_id}/batch",
+        content=b"".join(
+            struct.pack("!I", 8) + np.array([float(i)]).tobytes() for i in range(1200)
+        ),
+    )
+    chunks = client.portal.call(get_chunks, client.app, f"/stream/{node_id}/range")
+    assert len(chunks) == 3  # replay_batch_size is 500
+    frames = unpack_frames(b"".join(chunks))
+    assert [unpack(frame)[0]["sequence"] for frame in frames] == list(range(1, 1201))
+    client.delete(f"/upload/{node_id}")
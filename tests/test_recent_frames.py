@@ -0,0 +1,72 @@
+import json
+import time
+
+import msgpack
+import numpy as np
+
+from server import RecentFrames
+
+from .conftest import wait_for
+
+
+def frame(value):
+    return (np.array([value]).tobytes(), b"{}")
+
+
+def test_ring_keeps_the_last_frames():
+    recent = RecentFrames(size=3, max_bytes=1024, idle_ttl=60)
+    recent.put("a", [(seq_num, frame(seq_num)) for seq_num in range(1, 6)])
+    assert recent.get("a", [2, 3, 5, 6]) == [None, frame(3), frame(5), None]
+    assert (recent.hits, recent.misses) == (2, 2)
+    # Frames older than the window are not stored.
+    recent.put("a", [(1, frame(1))])
+    assert recent.get("a", [1]) == [None]
+    assert recent.nbytes == 3 * (8 + 2)
+
+    # A put loaded before a discard is dropped.
+    generation = recent.generation
+    recent.discard("a")
+    recent.put("a", [(6, frame(6))], generation)
+    assert len(recent) == 0 and recent.nbytes == 0
+
+
+def test_idle_and_oversized_nodes_are_dropped():
+    recent = RecentFrames(size=4, max_bytes=25, idle_ttl=60)
+    recent.put("a", [(1, frame(1))])
+    recent.put("b", [(1, frame(1))])
+    recent.put("c", [(1, frame(1))])
+    # Over max_bytes: the least recently used node goes.
+    assert recent.get("a", [1]) == [None]
+    assert recent.get("c", [1]) == [frame(1)]
+
+    recent.idle_ttl = 0.01
+    time.sleep(0.02)
+    recent.put("d", [(1, frame(1))])
+    assert len(recent) == 1
+
+
+def test_late_joiner_replays_from_memory(client):
+    """Frames appended while a node is followed are replayed without Redis."""
+    recent = client.app.state.recent
+    node_id = client.post("/upload").json()["node_id"]
+
+    with client.websocket_connect(f"/stream/single/{node_id}") as websocket:
+        for i in range(1, 6):
+            client.post(
+                f"/upload/{node_id}",
+                content=np.array([float(i)]).tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+        for i in range(1, 6):
+            assert json.loads(websocket.receive_text())["sequence"] == i
+
+        misses = recent.misses
+        url = f"/stream/single/{node_id}?seq_num=1&envelope_format=msgpack"
+        with client.websocket_connect(url) as late:
+            received = [msgpack.unpackb(late.receive_bytes()) for _ in range(5)]
+        assert [msg["payload"] for msg in received] == [[float(i)] for i in range(1, 6)]
+        assert recent.misses == misses
+
+    # Frames of nodes no longer followed are forgotten.
+    assert wait_for(lambda: len(recent) == 0)
+    client.delete(f"/upload/{node_id}")
@@ -0,0 +1,36 @@
+import json
+
+import numpy as np
+from starlette.testclient import TestClient
+
+from server import Settings, build_app
+
+
+def test_replay_spans_several_batches():
+    """A replay longer than one pipelined batch arrives complete and in order."""
+    settings = Settings(redis_url="redis://localhost:6379/0", replay_batch_size=4)
+    with TestClient(build_app(settings)) as client:
+        node_id = client.post("/upload").json()["node_id"]
+        for i in range(1, 11):
+            client.post(
+                f"/upload/{node_id}",
+                content=np.array([float(i)]).tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+
+        with client.websocket_connect(f"/stream/single/{node_id}?seq_num=1") as ws:
+            for i in range(1, 11):
+                msg = json.loads(ws.receive_text())
+                assert msg["sequence"] == i
+                assert msg["payload"] == [float(i)]
+
+            # Live frames follow the replay without a gap or a repeat.
+            client.post(
+                f"/upload/{node_id}",
+                content=np.array([11.0]).tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            msg = json.loads(ws.receive_text())
+            assert msg["sequence"] == 11
+
+        client.delete(f"/upload/{node_id}")
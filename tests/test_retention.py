@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+import redis
+from starlette.testclient import TestClient
+
+from server import Settings, build_app, node_key
+
+
+def test_caps_trim_oldest_frames_and_close_shortens_ttl():
+    """Per-node caps trim the oldest frames; closing a node shortens the
+    TTL of everything it still holds."""
+    settings = Settings(
+        redis_url="redis://localhost:6379/0",
+        max_frames_per_node=3,
+        max_bytes_per_node=5 * 8,
+        closed_ttl=30,
+    )
+    redis_client = redis.from_url(settings.redis_url)
+    with TestClient(build_app(settings)) as client:
+        node_id = client.post("/upload").json()["node_id"]
+        for i in range(5):
+            client.post(
+                f"/upload/{node_id}",
+                content=np.array([float(i)]).tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+        # The frame cap keeps the last three frames.
+        stored = [
+            redis_client.exists(node_key("data", node_id, i)) for i in range(1, 6)
+        ]
+        assert stored == [0, 0, 1, 1, 1]
+
+        # The byte cap (five float64) evicts two more frames for this one.
+        client.post(
+            f"/upload/{node_id}",
+            content=np.arange(4, dtype=np.float64).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        stored = [
+            redis_client.exists(node_key("data", node_id, i)) for i in range(1, 7)
+        ]
+        assert stored == [0, 0, 0, 0, 1, 1]
+        assert int(redis_client.get(node_key("bytes", node_id))) == 5 * 8
+
+        client.delete(f"/upload/{node_id}")
+        for i in (5, 6):
+            assert 0 < redis_client.ttl(node_key("data", node_id, i)) <= 30
+        assert not redis_client.exists(node_key("frames", node_id))
+    redis_client.close()
+
+
+def test_index_only_covers_live_frames():
+    """Entries of expired frames leave the index and the byte count, even
+    without caps."""
+    settings = Settings(redis_url="redis://localhost:6379/0", ttl=1)
+    redis_client = redis.from_url(settings.redis_url)
+    with TestClient(build_app(settings)) as client:
+        node_id = client.post("/upload").json()["node_id"]
+        # Writes keep the index alive past the TTL of its first frame.
+        for _ in range(2):
+            client.post(f"/upload/{node_id}", content=np.zeros(2).tobytes())
+            time.sleep(0.6)
+        client.post(f"/upload/{node_id}", content=np.zeros(1).tobytes())
+        assert redis_client.zcard(node_key("frames", node_id)) == 2
+        assert int(redis_client.get(node_key("bytes", node_id))) == 16 + 8
+        client.delete(f"/upload/{node_id}")
+    redis_client.close()
@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+import pytest
+import redis
+from starlette.testclient import TestClient
+
+from server import Settings, build_app, node_key
+
+from .conftest import list_all
+
+SHARDS = os.environ.get(
+    "TEST_REDIS_SHARDS", "redis://localhost:6379/1,redis://localhost:6379/2"
+).split(",")
+
+
+@pytest.fixture(params=["hash", "stream"])
+def sharded_client(request):
+    settings = Settings(redis_urls=SHARDS, storage_backend=request.param)
+    with TestClient(build_app(settings)) as client:
+        yield client
+
+
+def test_nodes_live_on_one_shard(sharded_client):
+    """Each node is stored, indexed and streamed from a single shard."""
+    client = sharded_client
+    shards = [redis.from_url(url) for url in SHARDS]
+    node_ids = [str(client.post("/upload").json()["node_id"]) for _ in range(20)]
+    for node_id in node_ids:
+        client.post(
+            f"/upload/{node_id}",
+            content=np.array([float(node_id)]).tobytes(),
+            headers={"Content-Type": "application/octet-stream"},
+        )
+
+    used = set()
+    for node_id in node_ids:
+        holders = [
+            i
+            for i, shard in enumerate(shards)
+            if shard.exists(node_key("seq_num", node_id))
+        ]
+        assert len(holders) == 1
+        used.update(holders)
+    assert used == set(range(len(shards)))
+
+    assert set(node_ids) <= set(list_all(client))
+
+    # Live delivery works whichever shard a node is on.
+    storage = client.app.state.storage
+    for shard in range(len(shards)):
+        node_id = next(n for n in node_ids if storage.shard_index(n) == shard)
+        with client.websocket_connect(f"/stream/single/{node_id}") as websocket:
+            client.post(
+                f"/upload/{node_id}",
+                content=np.array([2.0]).tobytes(),
+                headers={"Content-Type": "application/octet-stream"},
+            )
+            msg = json.loads(websocket.receive_text())
+            assert (msg["sequence"], msg["payload"]) == (2, [2.0])
+
+    for node_id in node_ids:
+        client.delete(f"/upload/{node_id}")
+    assert not set(node_ids) & set(list_all(client))
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from server import SlowConsumer, SubscriberQueue
+
+from .conftest import post_frame, wait_for
+
+
+def drain(queue):
+    items = []
+    while queue.qsize():
+        items.append(queue.get_nowait())
+    return items
+
+
+def test_queue_policies():
+    """Each policy keeps the queue bounded in its own way."""
+    block = SubscriberQueue(2, "block")
+    for seq_num in range(1, 6):
+        block.put_nowait(seq_num)
+    # Merged into the last item: catching up to 5 still sends every frame.
+    assert drain(block) == [(1, False), (5, False)]
+
+    drop_oldest = SubscriberQueue(2, "drop_oldest")
+    for seq_num in range(1, 6):
+        drop_oldest.put_nowait(seq_num)
+    assert drain(drop_oldest) == [(4, True), (5, False)]
+    assert drop_oldest.stats.dropped == 3
+
+    latest = SubscriberQueue(10, "latest")
+    for seq_num in range(1, 6):
+        latest.put_nowait(seq_num)
+    assert drain(latest) == [(5, True)]
+    # Coalescing is how the latest policy works, not an overflow.
+    assert latest.stats.coalesced == 4
+    assert latest.stats.dropped == 0
+
+    disconnect = SubscriberQueue(2, "disconnect")
+    for seq_num in range(1, 4):
+        disconnect.put_nowait(seq_num)
+    with pytest.raises(SlowConsumer):
+        disconnect.get_nowait()
+    assert disconnect.stats.disconnected == 1
+
+
+def test_reset_is_never_dropped():
+    """A reset supersedes what was queued and survives later overflows."""
+    queue = SubscriberQueue(2, "drop_oldest")
+    queue.put_nowait(7)
+    queue.put_nowait(None)
+    for seq_num in range(1, 4):
+        queue.put_nowait(seq_num)
+    assert drain(queue) == [(None, False), (3, True)]
+
+
+def test_many_overflow_is_resumable(client):
+    """A node that overflows is dropped with the sequence number to resume from."""
+    stats = client.app.state.subscriber_stats
+    node_id = client.post("/upload").json()["node_id"]
+
+    url = "/stream/many?credits=0&queue_size=1&queue_policy=disconnect"
+    with client.websocket_connect(url) as websocket:
+        websocket.send_text(
+            json.dumps({"action": "subscribe", "node_id": node_id, "seq_num": 1})
+        )
+        assert json.loads(websocket.receive_text())["event"] == "subscribed"
+        for i in range(3):
+            post_frame(client, node_id, [float(i)])
+        assert wait_for(lambda: stats.disconnected)
+
+        websocket.send_text(json.dumps({"action": "credit", "credits": 10}))
+        assert json.loads(websocket.receive_text()) == {
+            "event": "overflow",
+            "node_id": str(node_id),
+            "last_sequence": 0,
+        }
+
+        websocket.send_text(
+            json.dumps({"action": "subscribe", "node_id": node_id, "seq_num": 1})
+        )
+        replies = [json.loads(websocket.receive_text()) for _ in range(4)]
+        assert [msg["sequence"] for msg in replies if "sequence" in msg] == [1, 2, 3]
+
+    client.delete(f"/upload/{node_id}")
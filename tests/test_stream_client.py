@@ -0,0 +1,88 @@
+import asyncio
+
+import httpx
+import numpy as np
+import uvicorn
+
+from stream_client import Subscriber, Writer
+
+from .conftest import free_port
+
+
+def test_writer_batches_in_order(client):
+    """Frames written concurrently are batched and keep their order."""
+
+    async def write():
+        transport = httpx.ASGITransport(app=client.app)
+        http = httpx.AsyncClient(transport=transport, base_url="http://test")
+        requests = []
+
+        async def count(request):
+            requests.append(request)
+
+        http.event_hooks["request"].append(count)
+        async with Writer(None, client=http, batch_size=50) as writer:
+            node_id = await writer.create()
+            futures = [
+                await writer.write(node_id, np.full((2, 2), i, dtype=np.int32))
+                for i in range(120)
+            ]
+            await writer.flush()
+        await http.aclose()
+        return node_id, [await future for future in futures], len(requests)
+
+    node_id, seq_nums, request_count = client.portal.call(write)
+    assert seq_nums == list(range(1, 121))
+    assert request_count == 1 + 3  # create, then batches of 50, 50 and 20
+
+    response = client.get(f"/stream/{node_id}/range", params={"format": "ndjson"})
+    assert len(response.text.splitlines()) == 120
+    client.delete(f"/upload/{node_id}")
+
+
+def test_subscriber_resumes_after_disconnect(client):
+    """A subscriber cut off as a slow consumer resumes where it left off."""
+    port = free_port()
+
+    async def run():
+        config = uvicorn.Config(
+            client.app,
+            port=port,
+            lifespan="off",
+            log_level="warning",
+            timeout_graceful_shutdown=1,
+        )
+        server = uvicorn.Server(config)
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            async with Writer(f"http://127.0.0.1:{port}", batch_size=10) as writer:
+                node_id = await writer.create()
+                subscriber = Subscriber(
+                    f"ws://127.0.0.1:{port}",
+                    node_id,
+                    seq_num=1,
+                    params={"queue_policy": "disconnect", "queue_size": 1},
+                )
+                frames = subscriber.__aiter__()
+                await writer.write(node_id, np.zeros(4))
+                received = [(await anext(frames)).sequence]
+                # Overflow the subscriber's queue while it is not reading.
+                for i in range(1, 200):
+                    await writer.write(node_id, np.full(4, float(i)))
+                    if i % 10 == 0:
+                        await writer.flush()
+                await writer.close(node_id)
+                async for frame in frames:
+                    assert frame.data.tolist() == [float(frame.sequence - 1)] * 4
+                    received.append(frame.sequence)
+                await writer.delete(node_id)
+            return received, subscriber.reconnects
+        finally:
+            server.should_exit = True
+            await serving
+
+    received, reconnects = client.portal.call(run)
+    assert received == list(range(1, 201))
+    assert reconnects >= 1
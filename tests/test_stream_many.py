@@ -0,0 +1,65 @@
+import json
+
+from .conftest import post_frame
+
+
+def command(websocket, action, **kwargs):
+    "Send a control message and return the server's reply."
+    websocket.send_text(json.dumps({"action": action, **kwargs}))
+    return json.loads(websocket.receive_text())
+
+
+def test_many_nodes_on_one_socket(client):
+    """Frames from several nodes arrive on one socket tagged with their node_id."""
+    node_a = client.post("/upload").json()["node_id"]
+    node_b = client.post("/upload").json()["node_id"]
+
+    with client.websocket_connect("/stream/many?credits=10") as websocket:
+        assert command(websocket, "subscribe", node_id=node_a) == {
+            "event": "subscribed",
+            "node_id": str(node_a),
+        }
+        command(websocket, "subscribe", node_id=node_b)
+
+        post_frame(client, node_a, [1.0])
+        post_frame(client, node_b, [2.0])
+
+        received = {}
+        for _ in range(2):
+            msg = json.loads(websocket.receive_text())
+            received[msg["node_id"]] = (msg["sequence"], msg["payload"])
+        assert received == {str(node_a): (1, [1.0]), str(node_b): (1, [2.0])}
+
+    client.delete(f"/upload/{node_a}")
+    client.delete(f"/upload/{node_b}")
+
+
+def test_many_replay_and_credits(client):
+    """Replay honours seq_num, and frames are withheld until credit is granted."""
+    node_a = client.post("/upload").json()["node_id"]
+    node_b = client.post("/upload").json()["node_id"]
+    post_frame(client, node_a, [1.0])
+    post_frame(client, node_a, [2.0])
+
+    with client.websocket_connect("/stream/many?credits=1") as websocket:
+        websocket.send_text(
+            json.dumps({"action": "subscribe", "node_id": node_a, "seq_num": 1})
+        )
+        replies = [json.loads(websocket.receive_text()) for _ in range(2)]
+        assert {"event": "subscribed", "node_id": str(node_a)} in replies
+        msg = next(reply for reply in replies if "sequence" in reply)
+        assert (msg["node_id"], msg["sequence"]) == (str(node_a), 1)
+
+        # Out of credit: frame 2 of node_a is held back, and dropped when we
+        # unsubscribe, so the next frame we see belongs to node_b.
+        command(websocket, "unsubscribe", node_id=node_a)
+        command(websocket, "subscribe", node_id=node_b)
+        post_frame(client, node_b, [3.0])
+        websocket.send_text(json.dumps({"action": "credit", "credits": 1}))
+        msg = json.loads(websocket.receive_text())
+        assert (msg["node_id"], msg["sequence"]) == (str(node_b), 1)
+
+        assert command(websocket, "bogus")["event"] == "error"
+
+    client.delete(f"/upload/{node_a}")
+    client.delete(f"/upload/{node_b}")
@@ -0,0 +1,125 @@
+import struct
+
+import msgpack
+import numpy as np
+import pytest
+from starlette.testclient import TestClient
+
+from server import Settings, build_app
+
+
+@pytest.fixture
+def small_groups_client():
+    """A client whose split uploads are stored in groups of at most 100 bytes,
+    and whose batches are limited to 400 bytes."""
+    settings = Settings(
+        redis_url="redis://localhost:6379/0",
+        ingest_chunk_bytes=100,
+        max_batch_bytes=400,
+    )
+    with TestClient(build_app(settings)) as client:
+        yield client
+
+
+def chunked(body, size=7):
+    "Send body in small pieces, with chunked transfer encoding."
+    for i in range(0, len(body), size):
+        yield body[i : i + size]
+
+
+def read_back(client, node_id):
+    response = client.get(f"/stream/{node_id}/range", params={"format": "msgpack"})
+    unpacker = msgpack.Unpacker()
+    unpacker.feed(response.content)
+    return [(msg["sequence"], msg["payload"]) for msg in unpacker]
+
+
+def test_batches_are_stored_whole(small_groups_client):
+    client = small_groups_client
+    metrics = client.app.state.metrics
+    node_id = client.post("/upload").json()["node_id"]
+    frames = [np.full(4, float(i)).tobytes() for i in range(10)]
+
+    body = b"".join(struct.pack("!I", len(frame)) + frame for frame in frames)
+    response = client.post(f"/upload/{node_id}/batch", content=chunked(body))
+    assert response.json() == {"first_sequence": 1, "last_sequence": 10}
+    # One round trip, unlike split uploads of the same size.
+    assert sum(metrics.append_seconds.counts) == 1
+
+    response = client.post(
+        f"/upload/{node_id}/batch",
+        content=chunked(msgpack.packb(frames[:3])),
+        headers={"Content-Type": "application/msgpack"},
+    )
+    assert response.json() == {"first_sequence": 11, "last_sequence": 13}
+
+    stored = read_back(client, node_id)
+    assert [seq for seq, _ in stored] == list(range(1, 14))
+    assert stored[9][1] == [9.0] * 4 and stored[12][1] == [2.0] * 4
+
+    # 13 frames of 32 bytes are over the limit; none of them is stored.
+    response = client.post(
+        f"/upload/{node_id}/batch", content=body + body[: 3 * (4 + 32)]
+    )
+    assert response.status_code == 413
+    assert len(read_back(client, node_id)) == 13
+    client.delete(f"/upload/{node_id}")
+
+
+def test_upload_split_into_fixed_size_frames(client):
+    node_id = client.post("/upload").json()["node_id"]
+    images = np.arange(5 * 6, dtype=np.uint16).reshape(5, 2, 3)
+    response = client.post(
+        f"/upload/{node_id}",
+        content=chunked(images.tobytes()),
+        headers={"X-Frame-Size": "12", "X-Dtype": "<u2", "X-Shape": "2,3"},
+    )
+    assert response.json() == {
+        "first_sequence": 1,
+        "last_sequence": 5,
+        "ranges": [[1, 5]],
+    }
+    assert [payload for _, payload in read_back(client, node_id)] == images.tolist()
+    client.delete(f"/upload/{node_id}")
+
+
+def test_split_upload_reports_its_groups(small_groups_client):
+    client = small_groups_client
+    node_id = client.post("/upload").json()["node_id"]
+    response = client.post(
+        f"/upload/{node_id}",
+        content=chunked(np.zeros(40).tobytes()),
+        headers={"X-Frame-Size": "32"},
+    )
+    # Groups are closed once they reach 100 bytes: 4, 4 and 2 frames of 32.
+    assert response.json()["ranges"] == [[1, 4], [5, 8], [9, 10]]
+    client.delete(f"/upload/{node_id}")
+
+
+def test_malformed_streams_are_rejected(small_groups_client):
+    client = small_groups_client
+    node_id = client.post("/upload").json()["node_id"]
+    response = client.post(
+        f"/upload/{node_id}", content=b"a" * 150, headers={"X-Frame-Size": "20"}
+    )
+    assert response.status_code == 400
+    # The groups stored before the error are kept and reported.
+    assert (
+        response.json()["detail"]
+        == "Invalid upload after storing 1..5: Truncated frame"
+    )
+    response = client.post(
+        f"/upload/{node_id}/batch",
+        content=msgpack.packb([b"a", b"b"])[:-1],
+        headers={"Content-Type": "application/msgpack"},
+    )
+    assert response.status_code == 400
+    # Nothing of a malformed batch is stored.
+    assert client.post(f"/upload/{node_id}", content=b"c").json() == {"sequence": 6}
+    response = client.post(f"/upload/{node_id}/batch", content=b"")
+    assert response.status_code == 400
+    response = client.post(
+        f"/upload/{node_id}", content=b"ab", headers={"X-Frame-Size": "zero"}
+    )
+    assert response.status_code == 400
+    client.delete(f"/upload/{node_id}")
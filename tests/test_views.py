@@ -0,0 +1,162 @@
+import gzip
+import json
+import struct
+
+import numpy as np
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from server import StreamStorage, View
+
+from .conftest import post_image, unpack
+
+
+def test_view_slices_and_bins():
+    image = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    assert View.parse() is None
+    assert View.parse(bins="2").apply(image).tolist() == [[2.5, 4.5], [10.5, 12.5]]
+    assert View.parse(bins="2", reduce="max").apply(image).tolist() == [
+        [5, 7],
+        [13, 15],
+    ]
+    # Several bin sizes apply to the trailing axes.
+    assert View.parse(bins="4", reduce="min").apply(np.arange(10)).tolist() == [0, 4]
+    assert View.parse(bins="1,2").apply(image).shape == (4, 2)
+    assert View.parse(slices="1,::2").apply(image).tolist() == [4, 6]
+    assert View.parse(slices="0:2,1:3", bins="2").apply(image).tolist() == [[3.5]]
+    with pytest.raises(ValueError):
+        View.parse(slices="1:2:3:4")
+    with pytest.raises(ValueError):
+        View.parse(bins="0")
+    with pytest.raises(ValueError):
+        View.parse(slices="::0")
+
+
+def test_typed_frames_and_views(client):
+    """Declared dtype and shape survive, and subscribers can ask for a view."""
+    node_id = client.post("/upload").json()["node_id"]
+    images = [np.full((4, 4), i, dtype=np.uint16) for i in range(5)]
+    images[0] = np.arange(16, dtype=np.uint16).reshape(4, 4)
+    for image in images:
+        assert post_image(client, node_id, image).status_code == 200
+    client.post(f"/close/{node_id}", json={"reason": "done"})
+
+    url = f"/stream/single/{node_id}?seq_num=1&envelope_format=binary"
+    with client.websocket_connect(url) as websocket:
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["dtype"] == "<u2" and header["shape"] == [4, 4]
+        assert payload == images[0].tobytes()
+
+    with client.websocket_connect(url + "&bin=2&reduce=max") as websocket:
+        header, payload = unpack(websocket.receive_bytes())
+        assert header["shape"] == [2, 2]
+        assert np.frombuffer(payload, header["dtype"]).tolist() == [5, 7, 13, 15]
+
+    url = f"/stream/single/{node_id}?seq_num=1&every=2&slice=0,0:2"
+    with client.websocket_connect(url) as websocket:
+        received = [json.loads(websocket.receive_text()) for _ in range(4)]
+    # Frames 1, 3 and 5, then the end of the stream (frame 6) all the same.
+    assert [msg["sequence"] for msg in received] == [1, 3, 5, 6]
+    assert [msg["payload"] for msg in received] == [[0, 1], [2, 2], [4, 4], None]
+
+    client.delete(f"/upload/{node_id}")
+
+
+def test_views_that_do_not_fit_close_the_socket(client):
+    node_id = client.post("/upload").json()["node_id"]
+    post_image(client, node_id, np.zeros((4, 4)))
+    for params in ("slice=9", "slice=::0"):
+        url = f"/stream/single/{node_id}?seq_num=1&{params}"
+        with client.websocket_connect(url) as websocket:
+            with pytest.raises(WebSocketDisconnect) as e:
+                websocket.receive_text()
+            assert e.value.code == 1008
+    client.delete(f"/upload/{node_id}")
+
+
+def test_skipped_frames_are_not_fetched(client):
+    storage = client.app.state.storage
+    fetched = []
+    fetch = storage.fetch
+
+    async def count(node_id, seq_nums):
+        fetched.extend(seq_nums)
+        return await fetch(node_id, seq_nums)
+
+    node_id = client.post("/upload").json()["node_id"]
+    for i in range(10):
+        post_image(client, node_id, np.full(2, float(i)))
+    storage.fetch = count
+    try:
+        url = f"/stream/single/{node_id}?seq_num=1&every=4"
+        with client.websocket_connect(url) as websocket:
+            received = [json.loads(websocket.receive_text()) for _ in range(3)]
+    finally:
+        storage.fetch = fetch
+    assert [msg["sequence"] for msg in received] == [1, 5, 9]
+    # The last frame, which might have been the end of the stream, is read too.
+    assert fetched == [1, 5, 9, 10]
+    client.delete(f"/upload/{node_id}")
+
+
+def test_stream_backend_reads_only_the_frames_asked_for(client):
+    storage = client.app.state.storage
+    if not isinstance(storage, StreamStorage):
+        pytest.skip("The hash backend reads each frame on its own")
+    node_id = client.post("/upload").json()["node_id"]
+    for i in range(10):
+        post_image(client, node_id, np.full(2, float(i)))
+
+    redis_client = storage._redis_client
+    make_pipeline = redis_client.pipeline
+    returned = []
+
+    def pipeline(*args, **kwargs):
+        pipeline = make_pipeline(*args, **kwargs)
+        execute = pipeline.execute
+
+        async def count(*args, **kwargs):
+            results = await execute(*args, **kwargs)
+            returned.extend(entry for entries in results for entry in entries)
+            return results
+
+        pipeline.execute = count
+        return pipeline
+
+    redis_client.pipeline = pipeline
+    try:
+        frames = client.portal.call(storage.fetch, str(node_id), [1, 5, 9, 10])
+    finally:
+        del redis_client.pipeline
+    assert [np.frombuffer(payload)[0] for payload, _ in frames] == [0, 4, 8, 9]
+    assert len(returned) == 4
+    client.delete(f"/upload/{node_id}")
+
+
+def test_invalid_array_declaration(client):
+    node_id = client.post("/upload").json()["node_id"]
+    response = client.post(
+        f"/upload/{node_id}",
+        content=np.zeros(3).tobytes(),
+        headers={"X-Dtype": "float64", "X-Shape": "2,2"},
+    )
+    assert response.status_code == 400
+    response = client.post(
+        f"/upload/{node_id}", content=b"abcd", headers={"X-Dtype": "nonsense"}
+    )
+    assert response.status_code == 400
+    # Compressed payloads are checked once decompressed.
+    compressed = gzip.compress(np.zeros(5).tobytes())
+    response = client.post(
+        f"/upload/{node_id}",
+        content=compressed,
+        headers={"Content-Encoding": "gzip", "X-Shape": "3,3"},
+    )
+    assert response.status_code == 400
+    response = client.post(
+        f"/upload/{node_id}/batch",
+        content=struct.pack("!I", len(compressed)) + compressed,
+        headers={"X-Frame-Content-Encoding": "gzip", "X-Shape": "5"},
+    )
+    assert response.status_code == 200
+    client.delete(f"/upload/{node_id}")
@@ -1,5 +1,11 @@
+import asyncio
 import json
+
 import numpy as np
+import uvicorn
+import websockets
+
+from .conftest import free_port
 
 
 def test_subscribe_immediately_after_creation_websockets(client):
@@ -132,3 +138,38 @@ def test_subscribe_after_first_update_from_beginning_websockets(client):
 
     # Cleanup
     client.delete(f"/upload/{node_id}")
+
+
+def test_idle_subscriber_released_on_disconnect(client):
+    """A subscriber waiting for frames notices at once that its client left."""
+    hub = client.app.state.hub
+    node_id = client.post("/upload").json()["node_id"]
+    port = free_port()
+
+    async def run():
+        config = uvicorn.Config(
+            client.app,
+            port=port,
+            lifespan="off",
+            log_level="warning",
+            timeout_graceful_shutdown=1,
+        )
+        server = uvicorn.Server(config)
+        serving = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        try:
+            url = f"ws://127.0.0.1:{port}/stream/single/{node_id}"
+            async with websockets.connect(url):
+                while hub.subscriptions == 0:
+                    await asyncio.sleep(0.01)
+            # Well before any timeout or heartbeat would notice.
+            async with asyncio.timeout(0.5):
+                while hub.subscriptions:
+                    await asyncio.sleep(0.01)
+        finally:
+            server.should_exit = True
+            await serving
+
+    client.portal.call(run)
+    client.delete(f"/upload/{node_id}")